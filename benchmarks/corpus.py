@@ -0,0 +1,61 @@
+"""Genera PDF di prova di varie dimensioni con testo pseudo-casuale riproducibile.
+
+    python benchmarks/corpus.py benchmark_corpus --pages 10 100 500
+"""
+import argparse
+import os
+import random
+
+import fitz  # PyMuPDF
+
+VOCABULARY = ("analisi dati modello risultato procedura sistema processo valore misura errore metodo "
+              "documento capitolo sezione tabella figura esempio teoria pratica regola funzione "
+              "variabile parametro controllo qualità rischio gestione progetto obiettivo strumento").split()
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def page_text(rng, page_number):
+    lines = [f"Capitolo {page_number // 20 + 1} - Pagina {page_number + 1}"]
+    for _ in range(LINES_PER_PAGE):
+        words = rng.choices(VOCABULARY, k=WORDS_PER_LINE)
+        lines.append(" ".join(words).capitalize() + ".")
+    return "\n".join(lines)
+
+
+def make_pdf(path, num_pages, seed=0):
+    # Stesso seed, stesso contenuto: le misure sono confrontabili tra esecuzioni
+    rng = random.Random(seed)
+    with fitz.open() as doc:
+        for i in range(num_pages):
+            page = doc.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50),
+                                page_text(rng, i), fontsize=9)
+        doc.save(path)
+    return path
+
+
+def make_corpus(folder, sizes, seed=0):
+    """Crea (se mancano) i PDF con il numero di pagine indicato e ne restituisce i percorsi."""
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for num_pages in sizes:
+        path = os.path.join(folder, f"corpus_{num_pages}_pagine_{seed}.pdf")
+        if not os.path.exists(path):
+            make_pdf(path, num_pages, seed + num_pages)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("folder")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    for path in make_corpus(args.folder, args.pages, args.seed):
+        print(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""Server HTTP locali che imitano le API di OpenAI e di Hugging Face Inference.
+
+Rispondono con vettori deterministici e testo generato in streaming (SSE),
+con latenze e limiti di richieste configurabili, così i benchmark girano
+senza rete né API key. Si possono anche avviare da soli:
+
+    python benchmarks/mock_servers.py --port 8765 --rpm 600
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from array import array
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("il documento descrive una procedura per la gestione dei dati con attenzione alla qualità "
+         "del risultato e alle possibili eccezioni che si presentano durante l'analisi").split()
+
+
+def fake_vector(item, dim):
+    # Stesso testo, stesso vettore: la cache e la deduplica si comportano come con il servizio vero
+    seed = hashlib.sha256(json.dumps(item).encode("utf-8")).digest()
+    rng = random.Random(seed)
+    vector = [rng.random() - 0.5 for _ in range(dim)]
+    norm = sum(value * value for value in vector) ** 0.5
+    return [value / norm for value in vector]
+
+
+class RateLimiter:
+    """Token bucket per richieste al minuto; 0 disattiva il limite."""
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        """None se la richiesta è ammessa, altrimenti i secondi da attendere."""
+        if not self.rate:
+            return None
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return None
+            return (1.0 - self.tokens) / self.rate
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: la fine della risposta in streaming coincide con la chiusura della connessione
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server.mock
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        server.count("requests")
+        retry_after = server.limiter.retry_after()
+        if retry_after is not None:
+            server.count("rate_limited")
+            self._send_json({"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                            status=429, headers={"Retry-After": f"{retry_after:.2f}"})
+            return
+        if self.path.endswith("/embeddings"):
+            self._embeddings(server, body)
+        elif self.path.endswith("/chat/completions"):
+            self._chat(server, body)
+        else:
+            # Qualsiasi altro percorso risponde come text-generation-inference (Hugging Face)
+            self._text_generation(server, body)
+
+    def _send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+
+    def _event(self, payload):
+        data = payload if isinstance(payload, str) else json.dumps(payload)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _embeddings(self, server, body):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        time.sleep(server.embedding_latency + server.embedding_item_latency * len(inputs))
+        data = []
+        for i, item in enumerate(inputs):
+            vector = fake_vector(item, server.embedding_dim)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(item) if isinstance(item, list) else len(item) // 4 + 1 for item in inputs)
+        self._send_json({"object": "list", "data": data, "model": body.get("model", "mock"),
+                         "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    def _chat(self, server, body):
+        words = server.answer_words()
+        model = body.get("model", "mock")
+        if not body.get("stream"):
+            time.sleep(server.first_token_latency + server.token_latency * len(words))
+            self._send_json({"id": "mock", "object": "chat.completion", "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "finish_reason": "stop",
+                                          "message": {"role": "assistant", "content": "".join(words)}}],
+                             "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)}})
+            return
+        self._start_stream()
+        time.sleep(server.first_token_latency)
+        for i, word in enumerate(words):
+            delta = {"role": "assistant", "content": word} if i == 0 else {"content": word}
+            self._event({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]})
+            time.sleep(server.token_latency)
+        self._event({"id": "mock", "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        self._event("[DONE]")
+
+    def _text_generation(self, server, body):
+        words = server.answer_words()
+        if not body.get("stream"):
+            time.sleep(server.first_token_latency + server.token_latency * len(words))
+            self._send_json([{"generated_text": "".join(words)}])
+            return
+        self._start_stream()
+        time.sleep(server.first_token_latency)
+        for i, word in enumerate(words):
+            last = i == len(words) - 1
+            self._event({"index": i, "token": {"id": i, "text": word, "logprob": 0.0, "special": False},
+                         "generated_text": "".join(words) if last else None, "details": None})
+            time.sleep(server.token_latency)
+
+
+class MockServer:
+    """Server di prova per embedding (OpenAI) e generazione (OpenAI chat e Hugging Face).
+
+    Latenze in secondi: embedding_latency per richiesta più embedding_item_latency
+    per testo; first_token_latency prima del primo token e token_latency tra un
+    token e l'altro. requests_per_minute > 0 restituisce 429 con Retry-After.
+    """
+
+    def __init__(self, port=0, embedding_dim=1536, embedding_latency=0.05, embedding_item_latency=0.001,
+                 first_token_latency=0.3, token_latency=0.02, answer_tokens=150, requests_per_minute=0):
+        self.embedding_dim = embedding_dim
+        self.embedding_latency = embedding_latency
+        self.embedding_item_latency = embedding_item_latency
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.answer_tokens = answer_tokens
+        self.limiter = RateLimiter(requests_per_minute)
+        self.stats = {"requests": 0, "rate_limited": 0}
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.mock = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def answer_words(self):
+        return [WORDS[i % len(WORDS)] + " " for i in range(self.answer_tokens)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--rpm", type=int, default=0, help="richieste al minuto prima di rispondere 429 (0 = nessun limite)")
+    args = parser.parse_args()
+
+    server = MockServer(args.port, args.embedding_dim, args.embedding_latency,
+                        first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                        answer_tokens=args.answer_tokens, requests_per_minute=args.rpm)
+    print(f"OpenAI: OPENAI_BASE_URL={server.url}/v1  Hugging Face: modello {server.url}/hf")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
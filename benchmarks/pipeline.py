@@ -0,0 +1,235 @@
+"""Benchmark di caricamento, indicizzazione e domande senza API esterne.
+
+Genera un corpus di PDF, avvia i server di prova di mock_servers e misura
+lettura e indicizzazione (pagine/s, chunk/s) e domande in parallelo
+attraverso il QueryEngine (domande/s, latenza e tempo al primo token p50/p95),
+oltre al picco di memoria. Ogni backend gira in un processo separato con le
+stesse latenze simulate, così i risultati sono confrontabili:
+
+    python benchmarks/pipeline.py --pages 10 100 500 --backend openai llama --queries 40 --concurrency 8
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import VOCABULARY, make_corpus  # noqa: E402
+from mock_servers import MockServer  # noqa: E402
+
+
+def peak_rss_mb():
+    """Picco di memoria residente del processo (senza i processi che leggono i PDF)."""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 2 ** 20
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux restituisce KiB, macOS byte
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def make_questions(count, seed=0):
+    rng = random.Random(seed)
+    return [f"Cosa dice il documento su {' e '.join(rng.sample(VOCABULARY, 2))}?" for _ in range(count)]
+
+
+def make_embeddings(name):
+    from chatbot_core import embeddings
+
+    if name == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        # Senza controllo della lunghezza i testi partono così come sono: tiktoken scaricherebbe i dati dalla rete.
+        # Il backend viene sostituito nel registro perché anche gli indici caricati dalla libreria lo usino
+        embeddings.EMBEDDING_BACKENDS["openai"] = lambda: OpenAIEmbeddings(check_embedding_ctx_length=False)
+    return embeddings.make_embeddings(name)
+
+
+def make_backend(name, url):
+    from chatbot_core.generation import HuggingFaceBackend, OpenAIBackend
+
+    if name == "openai":
+        return OpenAIBackend()
+    return HuggingFaceBackend(model=f"{url}/hf", token="benchmark")
+
+
+def bench_indexing(paths, library, embeddings):
+    from chatbot_core.pipeline import index_pdf
+
+    results = []
+    for path in paths:
+        start = time.perf_counter()
+        # Come PdfLoaderThread e IndexingThread: lettura e indicizzazione in parallelo
+        doc_hash = index_pdf(path, library, embeddings)
+        elapsed = time.perf_counter() - start
+        entry = library.get(doc_hash)
+        results.append({
+            "pdf": os.path.basename(path),
+            "hash": doc_hash,
+            "pages": entry["num_pages"],
+            "chunks": entry["num_chunks"],
+            "seconds": elapsed,
+            "pages_per_second": entry["num_pages"] / elapsed,
+            "chunks_per_second": entry["num_chunks"] / elapsed,
+            "peak_rss_mb": peak_rss_mb(),
+        })
+    return results
+
+
+def bench_queries(questions, library, doc_hashes, backend, concurrency, rpm):
+    from chatbot_core.engine import QueryEngine
+    from chatbot_core.retrieval import make_retriever
+
+    retriever = make_retriever(library.load_merged(doc_hashes), backend, library.load_bm25(doc_hashes))
+    engine = QueryEngine(backend, max_in_flight=concurrency, requests_per_minute=rpm)
+    latencies = []
+    first_tokens = []
+    errors = []
+    lock = threading.Lock()
+
+    def submit(question):
+        submitted = time.perf_counter()
+
+        def on_done(answer):
+            with lock:
+                latencies.append(time.perf_counter() - submitted)
+
+        def on_first_token(seconds):
+            with lock:
+                first_tokens.append(time.perf_counter() - submitted)
+
+        def on_error(e):
+            with lock:
+                errors.append(str(e))
+
+        return engine.submit(question, retriever, on_first_token=on_first_token, on_done=on_done,
+                             on_error=on_error)
+
+    start = time.perf_counter()
+    futures = [submit(question) for question in questions]
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - start
+    engine.close()
+    return {
+        "queries": len(questions),
+        "errors": len(errors),
+        "seconds": elapsed,
+        "queries_per_second": len(latencies) / elapsed,
+        "latency_p50": percentile(latencies, 0.5),
+        "latency_p95": percentile(latencies, 0.95),
+        "first_token_p50": percentile(first_tokens, 0.5),
+        "first_token_p95": percentile(first_tokens, 0.95),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_backend(args, paths):
+    """Esegue il benchmark di un backend nel processo corrente e restituisce i risultati."""
+    server = MockServer(embedding_dim=args.embedding_dim, embedding_latency=args.embedding_latency,
+                        first_token_latency=args.first_token_latency, token_latency=args.token_latency,
+                        answer_tokens=args.answer_tokens, requests_per_minute=args.server_rpm).start()
+    os.environ["OPENAI_BASE_URL"] = f"{server.url}/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+    workdir = tempfile.mkdtemp(prefix="chatbot_benchmark_")
+    # Cache, libreria e metriche nuove per ogni esecuzione: si misura sempre a freddo
+    os.chdir(workdir)
+    try:
+        from chatbot_core.library import DocumentLibrary
+
+        backend = make_backend(args.backend[0], server.url)
+        embeddings = make_embeddings(args.embeddings)
+        library = DocumentLibrary(backend.library_dir)
+        indexing = bench_indexing(paths, library, embeddings)
+        queries = bench_queries(make_questions(args.queries, args.seed), library,
+                                [entry["hash"] for entry in indexing], backend, args.concurrency, args.rpm)
+        return {"backend": args.backend[0], "embeddings": args.embeddings, "workdir": workdir,
+                "indexing": indexing, "queries": queries, "server": dict(server.stats)}
+    finally:
+        server.stop()
+
+
+def print_report(result):
+    print(f"\n== {result['backend']} (embedding {result['embeddings']}) - 429 dal server: "
+          f"{result['server']['rate_limited']} su {result['server']['requests']} richieste")
+    for row in result["indexing"]:
+        print(f"{row['pdf']:<32} {row['pages']:>5} pagine {row['chunks']:>6} chunk {row['seconds']:>7.2f} s "
+              f"{row['pages_per_second']:>8.1f} pagine/s {row['chunks_per_second']:>8.1f} chunk/s "
+              f"RSS {row['peak_rss_mb'] or 0:.0f} MB")
+    q = result["queries"]
+    print(f"{q['queries']} domande ({q['errors']} errori) in {q['seconds']:.2f} s: {q['queries_per_second']:.2f} domande/s, "
+          f"latenza p50 {q['latency_p50'] or 0:.2f} s p95 {q['latency_p95'] or 0:.2f} s, "
+          f"primo token p50 {q['first_token_p50'] or 0:.2f} s p95 {q['first_token_p95'] or 0:.2f} s, "
+          f"RSS {q['peak_rss_mb'] or 0:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500], help="dimensioni dei PDF generati")
+    parser.add_argument("--corpus", default=os.path.join(tempfile.gettempdir(), "chatbot_benchmark_corpus"))
+    parser.add_argument("--backend", nargs="+", choices=["openai", "llama"], default=["openai", "llama"])
+    parser.add_argument("--embeddings", choices=["openai", "local"], default="openai",
+                        help="stessi embedding per tutti i backend; openai usa il server di prova")
+    parser.add_argument("--queries", type=int, default=40)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rpm", type=int, default=None, help="limite di richieste del QueryEngine")
+    parser.add_argument("--server-rpm", type=int, default=0, help="limite oltre il quale il server risponde 429")
+    parser.add_argument("--embedding-dim", type=int, default=1536)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.02)
+    parser.add_argument("--answer-tokens", type=int, default=150)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="file in cui salvare i risultati")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    paths = make_corpus(os.path.abspath(args.corpus), args.pages, args.seed)
+    if args.worker:
+        print(json.dumps(run_backend(args, paths)))
+        return
+
+    results = []
+    for backend in args.backend:
+        # Un processo per backend: memoria e cache non si sommano tra le esecuzioni
+        child = subprocess.run([sys.executable, os.path.abspath(__file__), *sys.argv[1:], "--backend", backend,
+                                "--corpus", os.path.abspath(args.corpus), "--worker"],
+                               capture_output=True, text=True)
+        if child.returncode != 0:
+            print(f"Benchmark {backend} non riuscito:\n{child.stderr.strip()}")
+            continue
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print_report(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if len(results) < len(args.backend):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
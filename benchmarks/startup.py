@@ -0,0 +1,98 @@
+"""Tempo di avvio a freddo delle applicazioni ChatBot.
+
+Ogni misura usa un interprete nuovo. Si controlla che i moduli importati
+all'avvio non carichino LangChain, FAISS, PyMuPDF o i client dei modelli e,
+se PyQt5 è installato, quanto tempo passa prima che la finestra sia mostrata.
+Esce con codice 1 se la mediana supera il limite:
+
+    python benchmarks/startup.py --runs 5 --max-seconds 1.0
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ["ChatBot OpenAI 3.5-Turbo.py", "ChatBot LLAMA-3.2-3B-Instruct.py"]
+# Moduli che non devono essere importati prima che la finestra sia visibile
+HEAVY_MODULES = ["langchain", "langchain_core", "langchain_community", "langchain_openai", "faiss", "fitz",
+                 "numpy", "openai", "tiktoken", "huggingface_hub", "torch", "sentence_transformers"]
+
+IMPORTS_CODE = """
+import json, sys, time
+start = time.perf_counter()
+import chatbot_core.generation, chatbot_core.indexing, chatbot_core.library, chatbot_core.retrieval
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": [m for m in %r if m in sys.modules]}))
+"""
+
+WINDOW_CODE = """
+import importlib.util, json, os, sys, time
+start = time.perf_counter()
+from PyQt5.QtWidgets import QApplication
+app = QApplication(sys.argv)
+spec = importlib.util.spec_from_file_location("chatbot_app", %r)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+heavy = [m for m in %r if m in sys.modules]
+window = module.MainWindow()
+window.show()
+app.processEvents()
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "heavy": heavy}), flush=True)
+# L'avvio in background è ancora in corso: si esce senza aspettarlo
+os._exit(0)
+"""
+
+
+def run_child(code, env):
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip())
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(name, code, runs, env):
+    results = [run_child(code, env) for _ in range(runs)]
+    seconds = [result["seconds"] for result in results]
+    heavy = sorted({module for result in results for module in result["heavy"]})
+    median = statistics.median(seconds)
+    print(f"{name}: mediana {median * 1000:.0f} ms, massimo {max(seconds) * 1000:.0f} ms"
+          + (f", moduli pesanti importati: {', '.join(heavy)}" if heavy else ""))
+    return median, heavy
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.0, help="limite per la mediana del tempo di avvio")
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=ROOT, QT_QPA_PLATFORM=os.getenv("QT_QPA_PLATFORM", "offscreen"))
+    # Le chiavi servono solo a superare il controllo all'avvio: nessuna richiesta viene inviata
+    env.setdefault("OPENAI_API_KEY", "benchmark")
+    env.setdefault("HUGGINGFACE_API_TOKEN", "benchmark")
+
+    failed = False
+    median, heavy = measure("import chatbot_core", IMPORTS_CODE % HEAVY_MODULES, args.runs, env)
+    failed |= bool(heavy) or median > args.max_seconds
+
+    try:
+        import PyQt5  # noqa: F401
+    except ImportError:
+        print("PyQt5 non installato: misura della finestra saltata")
+    else:
+        for script in SCRIPTS:
+            code = WINDOW_CODE % (os.path.join(ROOT, script), HEAVY_MODULES)
+            median, heavy = measure(script, code, args.runs, env)
+            failed |= bool(heavy) or median > args.max_seconds
+
+    if failed:
+        print(f"Avvio troppo lento (limite {args.max_seconds:.2f} s) o con import pesanti")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
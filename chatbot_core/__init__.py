@@ -0,0 +1 @@
+"""Componenti condivisi dai ChatBot OpenAI e LLAMA."""
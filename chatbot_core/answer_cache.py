@@ -0,0 +1,109 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+ANSWER_CACHE_PATH = "answer_cache.sqlite"
+ANSWER_CACHE_MAX_ENTRIES = 5000
+ANSWER_CACHE_TTL = 7 * 24 * 3600
+# Il livello semantico può restituire la risposta di una domanda simile ma diversa: va attivato esplicitamente
+SEMANTIC_CACHE_ENABLED = os.getenv("CHATBOT_SEMANTIC_CACHE", "0") == "1"
+# Distanza coseno massima perché una domanda sia considerata equivalente a una già fatta
+SEMANTIC_MAX_DISTANCE = float(os.getenv("CHATBOT_SEMANTIC_MAX_DISTANCE", "0.05"))
+
+
+def normalize_question(question):
+    question = re.sub(r"\s+", " ", question.strip().lower())
+    return question.rstrip("?!.;: ")
+
+
+class AnswerCache:
+    """Cache su disco delle risposte, per documento, modello e domanda.
+
+    Il primo livello confronta la domanda normalizzata; il secondo, solo con
+    semantic e se viene passata una funzione di embedding, riusa la risposta
+    di una domanda la cui distanza coseno è entro max_distance. Le voci
+    scadono dopo ttl secondi e oltre max_entries vengono eliminate quelle
+    usate meno di recente; le scritture avvengono solo in put e nel breve
+    aggiornamento di un hit, così più processi possono condividere il file.
+    """
+
+    def __init__(self, path=ANSWER_CACHE_PATH, max_entries=ANSWER_CACHE_MAX_ENTRIES,
+                 ttl=ANSWER_CACHE_TTL, max_distance=SEMANTIC_MAX_DISTANCE, semantic=SEMANTIC_CACHE_ENABLED):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.semantic = semantic
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, doc_key TEXT NOT NULL, model TEXT NOT NULL,"
+            " question TEXT NOT NULL, embedding BLOB, answer TEXT NOT NULL,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_doc_model ON answers (doc_key, model)")
+        self._conn.commit()
+
+    @staticmethod
+    def _key(doc_key, model, question):
+        return hashlib.sha256(f"{doc_key}\0{model}\0{normalize_question(question)}".encode("utf-8")).hexdigest()
+
+    def get(self, doc_key, model, question, embed_query=None):
+        """Restituisce (risposta, domanda_originale) oppure None.
+
+        embed_query viene chiamata solo se il livello semantico è attivo e il
+        confronto esatto non trova nulla.
+        """
+        now = time.time()
+        key = self._key(doc_key, model, question)
+        with self._lock:
+            # Solo letture: le voci scadute vengono ignorate qui ed eliminate in put
+            row = self._conn.execute("SELECT key, answer, question FROM answers WHERE key = ? AND created >= ?",
+                                     (key, now - self.ttl)).fetchone()
+        if row is None and embed_query is not None and self.semantic:
+            row = self._nearest(doc_key, model, embed_query(question), now - self.ttl)
+        if row is None:
+            return None
+        with self._lock:
+            self._conn.execute("UPDATE answers SET last_used = ? WHERE key = ?", (now, row[0]))
+            self._conn.commit()
+        return row[1], row[2]
+
+    def _nearest(self, doc_key, model, embedding, min_created):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT key, answer, question, embedding FROM answers"
+                " WHERE doc_key = ? AND model = ? AND embedding IS NOT NULL AND created >= ?",
+                (doc_key, model, min_created)
+            ).fetchall()
+        if not rows:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        matrix = np.stack([np.frombuffer(r[3], dtype=np.float32) for r in rows])
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        distances = 1.0 - (matrix @ query) / np.maximum(norms, 1e-12)
+        best = int(np.argmin(distances))
+        if distances[best] > self.max_distance:
+            return None
+        return rows[best][:3]
+
+    def put(self, doc_key, model, question, answer, embedding=None):
+        now = time.time()
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding is not None else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO answers (key, doc_key, model, question, embedding, answer, created, last_used)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (self._key(doc_key, model, question), doc_key, model, question, blob, answer, now, now),
+            )
+            self._conn.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl,))
+            self._conn.execute(
+                "DELETE FROM answers WHERE key IN (SELECT key FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
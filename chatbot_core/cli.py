@@ -0,0 +1,85 @@
+"""Risponde in batch, senza interfaccia grafica, alle domande di un file JSONL su un PDF.
+
+Esempio:
+    python -m chatbot_core.cli libro.pdf domande.jsonl risposte.jsonl --backend openai --concurrency 8
+
+Ogni riga di domande.jsonl è un oggetto con il campo "question" (gli altri campi
+vengono copiati nel risultato) oppure una semplice stringa JSON.
+"""
+import argparse
+import json
+import time
+
+from chatbot_core.answer_cache import AnswerCache
+from chatbot_core.embeddings import EMBEDDING_BACKENDS, make_embeddings
+from chatbot_core.engine import QueryEngine
+from chatbot_core.generation import BACKENDS, make_backend
+from chatbot_core.indexing import CHUNK_OVERLAP, CHUNK_SIZE
+from chatbot_core.library import DocumentLibrary
+from chatbot_core.page_cache import PageTextCache
+from chatbot_core.pipeline import index_pdf
+from chatbot_core.retrieval import make_retriever
+from chatbot_core.router import FALLBACK_BACKENDS, make_router
+
+
+def load_questions(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            yield item if isinstance(item, dict) else {"question": item}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("pdf", help="PDF su cui rispondere")
+    parser.add_argument("questions", help="file JSONL con le domande")
+    parser.add_argument("output", help="file JSONL in cui scrivere le risposte")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="openai")
+    parser.add_argument("--fallback", default=FALLBACK_BACKENDS,
+                        help="backend di riserva per risposte lente o fallite, es. llama oppure openai:gpt-4o-mini")
+    parser.add_argument("--concurrency", type=int, default=8, help="richieste al modello in parallelo")
+    parser.add_argument("--rpm", type=int, default=None, help="richieste al minuto consentite dal provider")
+    parser.add_argument("--embeddings", choices=sorted(EMBEDDING_BACKENDS), default=None,
+                        help="embedding per i nuovi indici (predefiniti quelli del backend)")
+    parser.add_argument("--no-cache", action="store_true", help="non usare la cache delle risposte")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="caratteri per chunk; cambiandolo il PDF viene ridiviso dal testo in cache")
+    parser.add_argument("--chunk-overlap", type=int, default=CHUNK_OVERLAP)
+    args = parser.parse_args(argv)
+
+    backend = make_router(make_backend(args.backend), args.fallback)
+    library = DocumentLibrary(backend.library_dir)
+    embeddings = make_embeddings(args.embeddings or backend.embeddings)
+    doc_hash = index_pdf(args.pdf, library, embeddings, page_cache=PageTextCache(),
+                         chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    retriever = make_retriever(library.load(doc_hash), backend, library.load_bm25([doc_hash]))
+    answer_cache = None if args.no_cache else AnswerCache()
+
+    engine = QueryEngine(backend, max_in_flight=max(1, args.concurrency), requests_per_minute=args.rpm)
+    questions = list(load_questions(args.questions))
+    start = time.perf_counter()
+    # Tutte le domande vengono accodate subito: è l'engine a limitarne la concorrenza e il ritmo
+    futures = [engine.submit(item["question"], retriever, answer_cache, doc_hash) for item in questions]
+
+    answered = 0
+    with open(args.output, "w", encoding="utf-8") as out:
+        for item, future in zip(questions, futures):
+            try:
+                answer = future.result()
+                record = dict(item, answer=answer.text, cached=answer.cached)
+            except Exception as e:
+                record = dict(item, error=str(e))
+            out.write(json.dumps(record, ensure_ascii=False) + "\n")
+            out.flush()
+            answered += 1
+    engine.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"{answered} domande in {elapsed:.1f} s ({answered / max(elapsed, 1e-9) * 60:.1f} domande/minuto)")
+
+
+if __name__ == "__main__":
+    main()
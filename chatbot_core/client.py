@@ -0,0 +1,195 @@
+"""Client del server HTTP (chatbot_core.server): la GUI lo usa al posto di libreria ed engine locali.
+
+Usa solo la libreria standard, così una postazione client non carica FAISS, embedding né client del modello.
+"""
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import namedtuple
+from concurrent.futures import Future
+from urllib.parse import quote
+
+from chatbot_core.metrics import metrics
+
+SERVER_TIMEOUT = 30
+INDEX_POLL_SECONDS = 1.0
+
+# Stessi campi di pipeline.Answer, senza importare la pipeline
+Answer = namedtuple("Answer", ["text", "cached", "question"])
+
+
+class ServerError(RuntimeError):
+    pass
+
+
+def _request(url, method="GET", body=None, headers=None, timeout=SERVER_TIMEOUT):
+    request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+    try:
+        return urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get("error", str(e))
+        except ValueError:
+            message = str(e)
+        raise ServerError(message) from None
+    except urllib.error.URLError as e:
+        raise ServerError(f"Server non raggiungibile: {e.reason}") from None
+
+
+def _request_json(url, method="GET", payload=None, timeout=SERVER_TIMEOUT):
+    body = json.dumps(payload).encode("utf-8") if payload is not None else None
+    with _request(url, method, body, {"Content-Type": "application/json"}, timeout) as response:
+        return json.loads(response.read())
+
+
+class RemoteLibrary:
+    """La parte di DocumentLibrary usata dalla GUI, con i documenti del server.
+
+    La selezione resta locale: ogni utente sceglie i propri documenti tra quelli condivisi.
+    documents restituisce l'ultimo elenco ricevuto senza attendere la rete;
+    refresh lo richiede al server e va chiamato fuori dal thread dell'interfaccia.
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip("/")
+        self._documents = []
+        self._selected = []
+
+    def refresh(self):
+        try:
+            self._documents = _request_json(f"{self.url}/documents")["documents"]
+        except ServerError as e:
+            # Server non raggiungibile: resta l'ultimo elenco ricevuto, le domande riporteranno l'errore
+            metrics.event("server_error", url=self.url, error=str(e))
+        return self._documents
+
+    def documents(self):
+        return self._documents
+
+    def get(self, doc_hash):
+        for entry in self._documents:
+            if entry["hash"] == doc_hash:
+                return entry
+        return None
+
+    def __contains__(self, doc_hash):
+        return self.get(doc_hash) is not None
+
+    def find_by_title(self, title):
+        for entry in self._documents:
+            if entry["title"] == title:
+                return entry["hash"]
+        return None
+
+    @property
+    def selected(self):
+        return [doc_hash for doc_hash in self._selected if doc_hash in self]
+
+    def select(self, doc_hashes):
+        self._selected = list(doc_hashes)
+
+    def chunked_with(self, doc_hash, *args):
+        # Il chunking è deciso dal server: basta che il documento ci sia
+        return doc_hash in self
+
+    def import_legacy(self, index_path, filename_path):
+        return None
+
+    def upload(self, file_path, on_progress=None):
+        """Invia il PDF al server e attende che sia indicizzato; restituisce l'hash del documento."""
+        with open(file_path, "rb") as f:
+            data = f.read()
+        headers = {"Content-Type": "application/pdf", "X-Filename": quote(os.path.basename(file_path))}
+        with _request(f"{self.url}/documents", "POST", data, headers) as response:
+            state = json.loads(response.read())
+        while state["status"] == "indexing":
+            if on_progress is not None:
+                on_progress(state)
+            time.sleep(INDEX_POLL_SECONDS)
+            state = _request_json(f"{self.url}/documents/{state['hash']}")
+        if state["status"] == "error":
+            raise ServerError(state.get("error", "Errore nella creazione dell'indice."))
+        self.refresh()
+        return state["hash"]
+
+
+class RemoteQueryEngine:
+    """Stessa interfaccia di QueryEngine.submit, con le domande inviate a /stream.
+
+    Al posto del retriever si passa la lista degli hash dei documenti: gli
+    indici sono caricati una sola volta sul server.
+    """
+
+    def __init__(self, url, user=None):
+        self.url = url.rstrip("/")
+        # Un id per client, non il nome di login: postazioni con lo stesso account non si annullano le domande
+        self.user = user or os.getenv("CHATBOT_USER") or uuid.uuid4().hex
+        self._sessions = {}
+        self._new_conversation = set()
+        self._lock = threading.Lock()
+
+    def reset_session(self, session):
+        with self._lock:
+            self._new_conversation.add(session)
+
+    def prefetch(self, question, retriever, doc_key="", session=None):
+        # Il recupero avviene sul server: non c'è nulla da anticipare qui
+        pass
+
+    def submit(self, question, retriever, answer_cache=None, doc_key="", session=None,
+               on_token=None, on_first_token=None, on_done=None, on_error=None):
+        future = Future()
+        future.set_running_or_notify_cancel()
+        cancelled = threading.Event()
+        with self._lock:
+            new_conversation = session in self._new_conversation
+            self._new_conversation.discard(session)
+            if session is not None:
+                previous = self._sessions.get(session)
+                if previous is not None:
+                    previous.set()
+                self._sessions[session] = cancelled
+        payload = {"question": question, "documents": list(retriever), "user": self.user,
+                   "new_conversation": new_conversation}
+        threading.Thread(target=self._stream, daemon=True,
+                         args=(payload, future, cancelled, on_token, on_first_token, on_done, on_error)).start()
+        return future
+
+    def _stream(self, payload, future, cancelled, on_token, on_first_token, on_done, on_error):
+        try:
+            body = json.dumps(payload).encode("utf-8")
+            with _request(f"{self.url}/stream", "POST", body, {"Content-Type": "application/json"}) as response:
+                for line in response:
+                    if cancelled.is_set():
+                        # Chiudere la connessione annulla la domanda anche sul server
+                        future.set_exception(ServerError("Domanda annullata."))
+                        return
+                    if not line.startswith(b"data: "):
+                        continue
+                    event = json.loads(line[len(b"data: "):])
+                    if "token" in event:
+                        if on_token is not None:
+                            on_token(event["token"])
+                    elif "first_token" in event:
+                        if on_first_token is not None:
+                            on_first_token(event["first_token"])
+                    elif "error" in event:
+                        raise ServerError(event["error"])
+                    elif event.get("done"):
+                        answer = Answer(event["answer"], event["cached"], event["question"])
+                        future.set_result(answer)
+                        if on_done is not None:
+                            on_done(answer)
+                        return
+            raise ServerError("Risposta del server interrotta.")
+        except Exception as e:
+            future.set_exception(e)
+            if on_error is not None and not cancelled.is_set():
+                on_error(e)
+
+    def close(self):
+        pass
@@ -0,0 +1,144 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_FILE = "index.faiss"
+DOCSTORE_FILE = "docstore.sqlite"
+# Sotto questo numero di vettori il training di IVF-PQ non è affidabile: si usa HNSW
+IVFPQ_MIN_VECTORS = 10_000
+IVF_NPROBE = 16
+HNSW_EF_SEARCH = 64
+# Grafo HNSW con vettori quantizzati a 8 bit per componente: meno della metà di un indice flat
+HNSW_FACTORY = "HNSW32,SQ8"
+# faiss >= 1.15 mappa da disco anche gli indici (HNSW compreso) che con IO_FLAG_MMAP finirebbero in memoria
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+
+
+class SqliteDocstore(Docstore):
+    """Docstore in SQLite: il testo di un chunk viene letto solo quando è tra i risultati.
+
+    Sostituisce il docstore serializzato con pickle, che va caricato per intero in memoria.
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " position INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+
+    def search(self, search):
+        with self._lock:
+            row = self._conn.execute("SELECT text, metadata FROM chunks WHERE id = ?", (search,)).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(id=search, page_content=row[0], metadata=json.loads(row[1]))
+
+    def write(self, rows):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO chunks (position, id, text, metadata) VALUES (?, ?, ?, ?)",
+                                   rows)
+            self._conn.commit()
+
+    def ids(self):
+        with self._lock:
+            return {position: doc_id for position, doc_id
+                    in self._conn.execute("SELECT position, id FROM chunks ORDER BY position")}
+
+
+def choose_format(index_format, num_vectors):
+    if index_format in ("auto", "ivfpq"):
+        return "ivfpq" if num_vectors >= IVFPQ_MIN_VECTORS else "hnsw"
+    return index_format
+
+
+def _pq_subquantizers(dim):
+    # Sottovettori di almeno 8 dimensioni che dividono esattamente il vettore
+    for m in (96, 64, 48, 32, 24, 16, 12, 8):
+        if dim % m == 0 and dim // m >= 8:
+            return m
+    return 1
+
+
+def _build_index(vectors, index_format):
+    num_vectors, dim = vectors.shape
+    if index_format == "hnsw":
+        index = faiss.index_factory(dim, HNSW_FACTORY)
+    else:
+        nlist = max(1, min(int(4 * math.sqrt(num_vectors)), num_vectors // 39))
+        index = faiss.index_factory(dim, f"IVF{nlist},PQ{_pq_subquantizers(dim)}")
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+
+def save_compact(vectorstore, folder_path, index_format):
+    """Salva il vectorstore in formato compatto: indice HNSW-SQ8 o IVF-PQ più docstore SQLite."""
+    os.makedirs(folder_path, exist_ok=True)
+    vectors = vectorstore.index.reconstruct_n(0, vectorstore.index.ntotal).astype(np.float32)
+    faiss.write_index(_build_index(vectors, index_format), os.path.join(folder_path, INDEX_FILE))
+
+    docstore_path = os.path.join(folder_path, DOCSTORE_FILE)
+    if os.path.exists(docstore_path):
+        os.remove(docstore_path)
+    rows = []
+    for position, doc_id in vectorstore.index_to_docstore_id.items():
+        doc = vectorstore.docstore.search(doc_id)
+        rows.append((position, doc_id, doc.page_content, json.dumps(doc.metadata, ensure_ascii=False)))
+    SqliteDocstore(docstore_path).write(rows)
+
+
+def load_compact(folder_path, embeddings):
+    """Carica un indice compatto mappando i vettori da disco, dove la versione di faiss lo consente."""
+    index_path = os.path.join(folder_path, INDEX_FILE)
+    try:
+        index = faiss.read_index(index_path, MMAP_FLAG | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        # Non tutte le versioni di faiss supportano il mmap per ogni tipo di indice
+        index = faiss.read_index(index_path)
+    try:
+        faiss.extract_index_ivf(index).nprobe = IVF_NPROBE
+    except RuntimeError:
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+    docstore = SqliteDocstore(os.path.join(folder_path, DOCSTORE_FILE))
+    return FAISS(embeddings, index, docstore, docstore.ids())
+
+
+class VectorStoreGroup:
+    """Più indici interrogati insieme senza copiarli in un unico indice in memoria.
+
+    Espone la parte dell'interfaccia di FAISS usata dal retriever e da BM25Index.
+    """
+
+    def __init__(self, vectorstores):
+        self.vectorstores = vectorstores
+        self.embeddings = vectorstores[0].embeddings
+        self.docstore = self
+        self.index_to_docstore_id = {}
+        for vectorstore in vectorstores:
+            for doc_id in vectorstore.index_to_docstore_id.values():
+                self.index_to_docstore_id[len(self.index_to_docstore_id)] = doc_id
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        embedding = self.embeddings.embed_query(query)
+        results = []
+        for vectorstore in self.vectorstores:
+            results.extend(vectorstore.similarity_search_with_score_by_vector(embedding, k=k, **kwargs))
+        return sorted(results, key=lambda item: item[1])[:k]
+
+    def search(self, doc_id):
+        for vectorstore in self.vectorstores:
+            doc = vectorstore.docstore.search(doc_id)
+            if isinstance(doc, Document):
+                return doc
+        return f"ID {doc_id} not found."
@@ -0,0 +1,87 @@
+from chatbot_core.indexing import estimate_tokens
+
+# Sotto questa soglia non conviene includere un pezzo di chunk troncato
+MIN_TRUNCATED_TOKENS = 50
+
+
+def _document_key(doc):
+    # Il titolo non basta: due PDF con lo stesso nome (Lezione1.pdf di due corsi) sono documenti diversi.
+    # Gli id dei chunk iniziano con l'hash del documento; per gli indici meno recenti resta il titolo
+    metadata = doc.metadata or {}
+    chunk_id = getattr(doc, "id", None) or ""
+    doc_hash = chunk_id.split(":", 1)[0] if chunk_id.count(":") > 1 else ""
+    return doc_hash or metadata.get("source") or ""
+
+
+def _merge_segments(docs):
+    """Unisce i chunk adiacenti o sovrapposti dello stesso documento.
+
+    Restituisce segmenti (documento, titolo, inizio, testo, pagina, pagina_fine, rango)
+    dove rango è la posizione migliore tra i chunk uniti nei risultati del retriever.
+    """
+    positioned = []
+    segments = []
+    for rank, doc in enumerate(docs):
+        metadata = doc.metadata or {}
+        start = metadata.get("start_index")
+        if start is None:
+            segments.append([_document_key(doc), metadata.get("source"), None, doc.page_content,
+                             metadata.get("page"), metadata.get("page_end"), rank])
+        else:
+            positioned.append((_document_key(doc), start, rank, doc))
+
+    current = None
+    for key, start, rank, doc in sorted(positioned, key=lambda item: (item[0], item[1])):
+        text = doc.page_content
+        metadata = doc.metadata
+        if current and current[0] == key and start <= current[2] + len(current[3]):
+            # Con chunk_overlap il testo comune compare in entrambi i chunk: si aggiunge solo la parte nuova
+            end = current[2] + len(current[3])
+            current[3] += text[end - start:]
+            current[5] = metadata.get("page_end", current[5])
+            current[6] = min(current[6], rank)
+        else:
+            current = [key, metadata.get("source"), start, text, metadata.get("page"), metadata.get("page_end"), rank]
+            segments.append(current)
+    return segments
+
+
+def _truncate(text, count_tokens, max_tokens):
+    while text and count_tokens(text) > max_tokens:
+        text = text[:int(len(text) * 0.9)]
+    return text
+
+
+def _header(segment):
+    _, source, _, _, page, page_end, _ = segment
+    parts = []
+    if source:
+        parts.append(source)
+    if page:
+        parts.append(f"pagina {page}" if page == page_end or not page_end else f"pagine {page}-{page_end}")
+    return f"[{', '.join(parts)}]\n" if parts else ""
+
+
+def pack_context(docs, token_budget, count_tokens=estimate_tokens):
+    """Costruisce il contesto per il modello dai documenti recuperati.
+
+    I chunk sovrapposti vengono uniti senza ripetere il testo in comune, i
+    segmenti più pertinenti entrano per primi finché c'è spazio nel budget di
+    token (misurato con count_tokens) e il risultato segue l'ordine del documento.
+    """
+    included = []
+    used = 0
+    for segment in sorted(_merge_segments(docs), key=lambda segment: segment[6]):
+        text = _header(segment) + segment[3]
+        tokens = count_tokens(text)
+        remaining = token_budget - used
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                break
+            text = _truncate(text, count_tokens, remaining)
+            tokens = count_tokens(text)
+        included.append((segment, text))
+        used += tokens
+
+    included.sort(key=lambda item: (item[0][1] or "", item[0][0], item[0][2] if item[0][2] is not None else -1))
+    return "\n\n".join(text for _, text in included)
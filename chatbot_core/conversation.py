@@ -0,0 +1,165 @@
+import re
+import threading
+
+from chatbot_core.metrics import metrics
+
+# Turni più recenti sempre riportati per intero; i precedenti confluiscono nel riassunto
+RECENT_TURNS = 2
+# Il riassunto parte quando la storia supera questa frazione del budget
+COMPACT_THRESHOLD = 0.6
+SUMMARY_MAX_WORDS = 150
+# Segnali di una domanda che da sola non si capisce ("e il secondo teorema?", "spiegalo meglio"):
+# congiunzione iniziale, rimandi espliciti a quanto detto prima, un dimostrativo senza
+# riferimento nella domanda stessa o nessuna parola di contenuto
+FOLLOW_UP_START_RE = re.compile(r"^(e|ed|ma|invece|anche|allora|quindi|poi|and|but|what about|how about)\b")
+FOLLOW_UP_REFERENCE_RE = re.compile(
+    r"\b(suddett[oaie]|precedente|"
+    r"((il|la|lo|i|gli|le) |l')(prim[oaie]|second[oaie]|terz[oaie]|ultim[oaie]|altr[oaie])(?=\W*$)|"
+    r"(spiega|dimostra|riassumi|descrivi|calcola|applica|ripeti|semplifica|approfondisci|dimmi|fammi|dammi)"
+    r"(lo|la|li|le|ne|melo|mela|meli|mele|mene)|"
+    r"spiega(mi)? meglio|in che senso|un altro esempio|altri esempi|"
+    r"(hai|avevi) (appena )?(detto|spiegato|scritto|citato)|you (just )?(said|mentioned|explained))\b"
+)
+# "questo documento" o "il ciclo di Carnot ... perché è reversibile?" si capiscono da soli:
+# il dimostrativo conta solo se non è seguito da un nome e nessuna parola prima dice a cosa si riferisce
+FOLLOW_UP_DEMONSTRATIVE_RE = re.compile(
+    r"(quest|quell)[oaie]?|quegli|(stess|ess)[oaie]|ciò|this|that|these|those|it|its|they|them"
+)
+# Solo pronomi: anche seguiti da un nome ("its entropy") rimandano a qualcosa di già detto
+FOLLOW_UP_PRONOUNS = {"ciò", "esso", "essa", "essi", "esse", "it", "its", "they", "them"}
+FOLLOW_UP_RELATIVE = {"che", "cui", "which", "who", "whom"}
+FOLLOW_UP_FILLER = {
+    "e", "ed", "ma", "o", "poi", "perché", "perche", "come", "mai", "cosa", "cos", "che", "cioè", "quindi",
+    "allora", "invece", "anche", "sì", "si", "no", "ok", "in", "senso", "di", "più", "meglio", "ancora", "ora",
+    "il", "lo", "la", "l", "i", "gli", "le", "un", "uno", "una", "a", "da", "con", "su", "per", "tra", "fra",
+    "del", "dello", "della", "dei", "degli", "delle", "al", "allo", "alla", "ai", "agli", "alle", "nel", "nella",
+    "sul", "sulla", "è", "sono", "era", "qual", "quale", "quali", "chi", "dove", "quando", "mi", "ti", "ci",
+    "puoi", "può", "potresti", "vuol", "dire", "significa", "intendi", "vero", "spiega", "spiegami", "spieghi",
+    "dimmi", "fammi", "dammi", "esempio",
+    "why", "how", "so", "the", "an", "of", "to", "on", "for", "with", "about", "is", "are", "was", "were", "s",
+    "what", "which", "who", "where", "when", "does", "do", "did", "can", "could", "you", "me", "mean", "means",
+    "explain", "tell", "give", "example", "more", "again", "now", "then", "true",
+}
+
+
+def _is_content(word):
+    return word not in FOLLOW_UP_FILLER and not FOLLOW_UP_DEMONSTRATIVE_RE.fullmatch(word)
+
+
+def _dangling_reference(words):
+    """True se un dimostrativo della domanda rimanda a qualcosa che nella domanda non c'è."""
+    for i, word in enumerate(words):
+        if _is_content(word):
+            # Da qui in poi un dimostrativo può riferirsi a questa parola
+            return False
+        if not FOLLOW_UP_DEMONSTRATIVE_RE.fullmatch(word):
+            continue
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if following in FOLLOW_UP_RELATIVE:
+            # "ciò che ...", "quello che ...": il riferimento è la frase che segue
+            continue
+        if word not in FOLLOW_UP_PRONOUNS and following and _is_content(following):
+            # "questo documento", "quella formula"
+            continue
+        return True
+    return False
+
+
+class Conversation:
+    """Storia di una sessione di domande: riassunto dei turni vecchi più gli ultimi turni completi.
+
+    Quando la storia supera COMPACT_THRESHOLD del budget, i turni meno recenti
+    vengono riassunti dal modello in background con executor; nel frattempo
+    history_text si limita comunque a token_budget, scartando i turni più vecchi.
+    """
+
+    def __init__(self, backend, executor, token_budget=None):
+        self.backend = backend
+        self.executor = executor
+        self.token_budget = token_budget or backend.history_token_budget
+        self.summary = ""
+        self.turns = []
+        self._compacting = None
+        # Cambia a ogni clear: un riassunto avviato prima non si applica alla nuova conversazione
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _turn_text(self, question, answer):
+        return f"Utente: {question}\nAssistente: {answer}"
+
+    def history_text(self):
+        """Storia da passare al modello, entro token_budget."""
+        with self._lock:
+            summary = self.summary
+            turns = list(self.turns)
+        count = self.backend.count_tokens
+        parts = []
+        tokens = 0
+        if summary:
+            parts.append(f"Riassunto della conversazione precedente: {summary}")
+            tokens = count(parts[0])
+        recent = []
+        for question, answer in reversed(turns):
+            text = self._turn_text(question, answer)
+            text_tokens = count(text)
+            if tokens + text_tokens > self.token_budget:
+                break
+            recent.append(text)
+            tokens += text_tokens
+        return "\n\n".join(parts + recent[::-1])
+
+    def is_follow_up(self, question):
+        """True se la domanda dipende dal turno precedente e non si capisce da sola."""
+        with self._lock:
+            if not self.turns:
+                return False
+        text = question.strip().lower()
+        words = re.findall(r"\w+", text)
+        return bool(FOLLOW_UP_START_RE.match(text) or FOLLOW_UP_REFERENCE_RE.search(text)
+                    or not any(_is_content(word) for word in words) or _dangling_reference(words))
+
+    def retrieval_query(self, question):
+        """Testo da usare per il recupero: le domande di seguito vengono unite alla precedente."""
+        if not self.is_follow_up(question):
+            return question
+        with self._lock:
+            previous = self.turns[-1][0] if self.turns else ""
+        return f"{previous} {question}" if previous else question
+
+    def add_turn(self, question, answer):
+        with self._lock:
+            self.turns.append((question, answer))
+            if self._compacting is not None or len(self.turns) <= RECENT_TURNS:
+                return
+            tokens = sum(self.backend.count_tokens(self._turn_text(*turn)) for turn in self.turns)
+            if tokens <= self.token_budget * COMPACT_THRESHOLD:
+                return
+            old_turns = self.turns[:-RECENT_TURNS]
+            self._compacting = self.executor.submit(self._compact, self.summary, old_turns, self._generation)
+
+    def _compact(self, summary, old_turns, generation):
+        text = "\n\n".join(self._turn_text(*turn) for turn in old_turns)
+        if summary:
+            text = f"Riassunto precedente: {summary}\n\n{text}"
+        try:
+            with metrics.span("history_summary", backend=self.backend.name):
+                new_summary = self.backend.summarize(text, SUMMARY_MAX_WORDS)
+        except Exception as e:
+            # Senza riassunto la storia resta comunque nel budget: si perdono solo i turni più vecchi
+            metrics.event("history_summary_error", backend=self.backend.name, error=str(e))
+            new_summary = None
+        with self._lock:
+            if generation != self._generation:
+                return
+            if new_summary:
+                self.summary = new_summary
+                # I turni arrivati durante il riassunto restano in coda
+                self.turns = self.turns[len(old_turns):]
+            self._compacting = None
+
+    def clear(self):
+        with self._lock:
+            self.summary = ""
+            self.turns = []
+            self._compacting = None
+            self._generation += 1
@@ -0,0 +1,115 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+
+from langchain_core.embeddings import Embeddings
+
+from chatbot_core.metrics import metrics
+
+EMBEDDING_CACHE_PATH = "embedding_cache.sqlite"
+EMBEDDING_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+
+def embedding_model_name(embeddings):
+    # OpenAIEmbeddings espone "model", HuggingFaceEmbeddings "model_name"
+    name = getattr(embeddings, "model", None) or getattr(embeddings, "model_name", None)
+    return f"{type(embeddings).__name__}:{name}"
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings con cache su disco indirizzata per contenuto.
+
+    Ogni vettore è salvato in SQLite con chiave sha256(modello + testo del chunk),
+    quindi lo stesso chunk non viene mai inviato due volte all'API, anche tra
+    PDF diversi. Oltre max_bytes vengono eliminati i vettori usati meno di recente.
+    """
+
+    def __init__(self, embeddings, path=EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_BYTES, name=None):
+        self.embeddings = embeddings
+        # Nome del backend ("openai", "local"), registrato nel manifest degli indici
+        self.name = name
+        self.model_name = embedding_model_name(embeddings)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys):
+        found = {}
+        with self._lock:
+            # SQLite limita il numero di parametri per query
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((key, array("f", blob).tolist()) for key, blob in rows)
+            if found:
+                now = time.time()
+                self._conn.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                       [(now, key) for key in found])
+                self._conn.commit()
+        return found
+
+    def _store(self, items):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array("f", vector).tobytes(), now) for key, vector in items],
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        size = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings").fetchone()[0]
+        if size <= self.max_bytes:
+            return
+        excess = size - self.max_bytes
+        freed = 0
+        stale = []
+        for key, length in self._conn.execute("SELECT key, LENGTH(vector) FROM embeddings ORDER BY last_used"):
+            stale.append((key,))
+            freed += length
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", stale)
+        self._conn.commit()
+
+    def embed_documents(self, texts):
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = list(zip(missing.keys(), vectors))
+            self._store(computed)
+            cached.update(computed)
+
+        metrics.count("embedding_cache_hits", len(texts) - len(missing))
+        metrics.count("embedding_cache_misses", len(missing))
+        return [cached[key] for key in keys]
+
+    def embed_query(self, text):
+        # Alcuni modelli trattano query e documenti in modo diverso: chiavi separate
+        key = self._key(f"query\0{text}")
+        cached = self._lookup([key])
+        if key in cached:
+            return cached[key]
+        vector = self.embeddings.embed_query(text)
+        self._store([(key, vector)])
+        return vector
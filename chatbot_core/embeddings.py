@@ -0,0 +1,77 @@
+import functools
+import os
+
+from langchain_core.embeddings import Embeddings
+
+from chatbot_core.embedding_cache import CachedEmbeddings
+from chatbot_core.library import DEFAULT_EMBEDDINGS
+
+# Modello multilingue piccolo: gira bene su CPU e gestisce testi italiani
+LOCAL_EMBEDDING_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+LOCAL_EMBEDDING_THREADS = int(os.getenv("CHATBOT_EMBEDDING_THREADS", "0")) or os.cpu_count() or 1
+LOCAL_EMBEDDING_BATCH_SIZE = 64
+
+
+class LocalEmbeddings(Embeddings):
+    """Embeddings calcolati in locale su CPU con sentence-transformers, senza rete né API key.
+
+    I testi vengono codificati a blocchi in un'unica chiamata vettorizzata;
+    threads limita i thread usati da PyTorch.
+    """
+
+    # Il modello usa già tutti i thread assegnati: richieste parallele si ostacolerebbero
+    parallel_requests = 1
+
+    def __init__(self, model_name=LOCAL_EMBEDDING_MODEL, threads=LOCAL_EMBEDDING_THREADS,
+                 batch_size=LOCAL_EMBEDDING_BATCH_SIZE):
+        try:
+            import torch
+            from sentence_transformers import SentenceTransformer
+        except ImportError:
+            raise ImportError("Per gli embedding locali installa sentence-transformers: "
+                              "pip install sentence-transformers") from None
+        torch.set_num_threads(threads)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed_documents(self, texts):
+        vectors = self.model.encode(list(texts), batch_size=self.batch_size, convert_to_numpy=True,
+                                    normalize_embeddings=True, show_progress_bar=False)
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def _openai_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings()
+
+
+EMBEDDING_BACKENDS = {
+    "openai": _openai_embeddings,
+    "local": LocalEmbeddings,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def make_embeddings(name=None):
+    """Embeddings usati per indicizzare e interrogare i documenti, con cache su disco.
+
+    name sceglie il backend ("openai" o "local"); senza nome si usa
+    CHATBOT_EMBEDDINGS o OpenAI. Ogni backend viene creato una volta sola,
+    così il modello locale non viene ricaricato per ogni indice.
+    """
+    name = name or os.getenv("CHATBOT_EMBEDDINGS", DEFAULT_EMBEDDINGS)
+    try:
+        factory = EMBEDDING_BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Embedding sconosciuti: {name}. Disponibili: {', '.join(EMBEDDING_BACKENDS)}") from None
+    return CachedEmbeddings(factory(), name=name)
+
+
+def embedding_workers(embeddings, default):
+    """Richieste di embedding da inviare in parallelo per questo backend."""
+    inner = getattr(embeddings, "embeddings", embeddings)
+    return getattr(inner, "parallel_requests", default)
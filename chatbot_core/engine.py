@@ -0,0 +1,193 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from chatbot_core.conversation import Conversation
+from chatbot_core.errors import status_code
+from chatbot_core.metrics import metrics
+from chatbot_core.pipeline import finish_answer, prepare_answer, record_first_token, record_generation
+from chatbot_core.prefetch import RetrievalPrefetcher
+
+MAX_IN_FLIGHT = 4
+MAX_RETRIES = 5
+
+
+class TokenBucket:
+    """Dosa l'avvio delle richieste al ritmo consentito dal provider.
+
+    Dopo un 429 con Retry-After tutte le richieste restano in attesa fino
+    alla scadenza indicata, non solo quella che lo ha ricevuto.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class QueryEngine:
+    """Esegue le domande su un event loop asyncio in un thread dedicato.
+
+    Limita le richieste contemporanee al modello, ne dosa l'avvio con un
+    token bucket, ripete quelle respinte con 429 rispettando Retry-After e
+    annulla la domanda precedente della stessa sessione quando ne arriva una
+    nuova. Il backend (e quindi il client HTTP) è condiviso da tutte le richieste.
+    Con memory ogni sessione ha una Conversation, così le domande di seguito
+    vengono capite; i riassunti della storia girano in un thread separato.
+    prefetch cerca i documenti mentre la domanda viene ancora scritta.
+    """
+
+    def __init__(self, backend, max_in_flight=MAX_IN_FLIGHT, requests_per_minute=None, max_retries=MAX_RETRIES,
+                 memory=True):
+        self.backend = backend
+        self.max_retries = max_retries
+        self.memory = memory
+        self._conversations = {}
+        self._summary_pool = ThreadPoolExecutor(max_workers=1)
+        self._prefetch_pool = ThreadPoolExecutor(max_workers=1)
+        self.prefetcher = RetrievalPrefetcher(self._prefetch_pool)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        self._sessions = {}
+        self._semaphore = None
+        self._bucket = None
+        self._run(self._setup(max_in_flight, requests_per_minute or backend.requests_per_minute)).result()
+
+    async def _setup(self, max_in_flight, requests_per_minute):
+        # Semaforo e token bucket vanno creati dentro l'event loop che li userà
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._bucket = TokenBucket(requests_per_minute)
+
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def conversation(self, session):
+        conversation = self._conversations.get(session)
+        if conversation is None:
+            conversation = self._conversations[session] = Conversation(self.backend, self._summary_pool)
+        return conversation
+
+    def reset_session(self, session):
+        """Dimentica la storia della sessione, ad esempio quando cambiano i documenti."""
+        conversation = self._conversations.get(session)
+        if conversation is not None:
+            conversation.clear()
+
+    def prefetch(self, question, retriever, doc_key="", session=None):
+        """Avvia in background il recupero dei documenti per una domanda non ancora inviata."""
+        conversation = self.conversation(session) if session is not None and self.memory else None
+        query = conversation.retrieval_query(question) if conversation is not None else question
+        self.prefetcher.prefetch(retriever, doc_key, query)
+
+    def submit(self, question, retriever, answer_cache=None, doc_key="", session=None,
+               on_token=None, on_first_token=None, on_done=None, on_error=None):
+        """Accoda una domanda e restituisce un concurrent.futures.Future con la Answer.
+
+        Con session, una domanda ancora in corso della stessa sessione viene annullata.
+        Le callback vengono chiamate dal thread dell'engine.
+        """
+        conversation = self.conversation(session) if session is not None and self.memory else None
+        future = self._run(self._answer(question, retriever, answer_cache, doc_key, conversation,
+                                        on_token, on_first_token, on_done, on_error))
+        if session is not None:
+            previous = self._sessions.get(session)
+            if previous is not None and not previous.done():
+                previous.cancel()
+            self._sessions[session] = future
+        return future
+
+    async def _answer(self, question, retriever, answer_cache, doc_key, conversation,
+                      on_token, on_first_token, on_done, on_error):
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        try:
+            # Cache e FAISS sono sincroni: vengono eseguiti nel pool di thread del loop
+            prepared = await loop.run_in_executor(None, prepare_answer, question, retriever, self.backend,
+                                                  answer_cache, doc_key, conversation, self.prefetcher)
+            if prepared.answer:
+                answer = prepared.answer
+            else:
+                parts, model = await self._generate(question, prepared.context, prepared.history,
+                                                    on_token, on_first_token)
+                answer = await loop.run_in_executor(None, finish_answer, question, parts, self.backend,
+                                                    prepared, answer_cache, doc_key, model)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            metrics.event("answer_error", backend=self.backend.name, error=str(e))
+            if on_error:
+                on_error(e)
+            raise
+        metrics.observe("answer_seconds", time.perf_counter() - start, backend=self.backend.name,
+                        cached=answer.cached)
+        await loop.run_in_executor(None, metrics.export)
+        if conversation is not None:
+            conversation.add_turn(question, answer.text)
+        if on_done:
+            on_done(answer)
+        return answer
+
+    async def _generate(self, question, context, history, on_token, on_first_token):
+        for attempt in range(self.max_retries + 1):
+            await self._bucket.acquire()
+            parts = []
+            try:
+                async with self._semaphore:
+                    start = time.perf_counter()
+                    stream = self.backend.astream(question, context, history)
+                    async for token in stream:
+                        if not parts:
+                            record_first_token(self.backend, time.perf_counter() - start, on_first_token)
+                        parts.append(token)
+                        if on_token:
+                            on_token(token)
+                    record_generation(self.backend, time.perf_counter() - start, parts)
+                # Con un GenerationRouter la risposta può arrivare da un backend di riserva
+                served_by = getattr(stream, "backend", None) or self.backend
+                return parts, served_by.model_name
+            except Exception as e:
+                # Si ripete solo un 429 arrivato prima di mostrare qualcosa all'utente
+                if status_code(e) != 429 or parts or attempt == self.max_retries:
+                    raise
+                delay = _retry_after(e) or min(60.0, 2 ** attempt + random.random())
+                metrics.count("rate_limited", backend=self.backend.name)
+                metrics.event("rate_limited", backend=self.backend.name, retry_in=delay, attempt=attempt + 1)
+                self._bucket.pause(delay)
+
+    def close(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._summary_pool.shutdown(wait=False, cancel_futures=True)
+        self._prefetch_pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,27 @@
+import re
+
+# Errori per cui la stessa richiesta può riuscire poco dopo; gli altri (chiave errata, richiesta non valida) no
+TRANSIENT_STATUS = {408, 409, 429}
+TRANSIENT_ERROR_PATTERN = re.compile(r"Timeout|Connect")
+# Richiesta oltre il limite di token del modello: va divisa, ripeterla uguale non serve
+TOO_LARGE_PATTERN = re.compile(r"maximum context length|too many tokens|too large|token limit", re.I)
+
+
+def status_code(error):
+    """Codice HTTP di un errore di OpenAI, httpx o huggingface_hub, oppure None."""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_transient(error):
+    status = status_code(error)
+    if status is not None:
+        return status in TRANSIENT_STATUS or status >= 500
+    # Timeout e connessioni interrotte di openai, httpx, requests e della libreria standard
+    return any(TRANSIENT_ERROR_PATTERN.search(cls.__name__) for cls in type(error).__mro__)
+
+
+def is_too_large(error):
+    return status_code(error) in (400, 413) and bool(TOO_LARGE_PATTERN.search(str(error)))
@@ -0,0 +1,165 @@
+import functools
+import os
+
+from chatbot_core.indexing import estimate_tokens
+
+OPENAI_MODEL = "gpt-3.5-turbo"
+# meta-llama/Llama-3.2-3B-Instruct  # meta-llama/Llama-3.1-8B-Instruct   # meta-llama/Llama-3.3-70B-Instruct
+HF_MODEL = "meta-llama/Llama-3.2-3B-Instruct"
+SUMMARY_INSTRUCTIONS = ("Riassumi la conversazione seguente tra un utente e un assistente che risponde su un documento."
+                        " Conserva argomenti, nomi, numeri e riferimenti alle pagine necessari per capire le domande"
+                        " successive. Scrivi al massimo {max_words} parole.")
+
+
+class OpenAIBackend:
+    """Generazione delle risposte con i modelli chat di OpenAI."""
+
+    name = "openai"
+    library_dir = "library_OpenAI"
+    legacy_index = ("faiss_index_OpenAI", "filename_1.json")
+    retriever_k = 20
+    # Token di contesto recuperato: gpt-3.5-turbo ha una finestra di 16k token
+    context_token_budget = 6000
+    # Parte del budget di contesto riservata alla storia della conversazione
+    history_token_budget = 1500
+    embeddings = "openai"
+    requests_per_minute = 500
+    # Senza documenti pertinenti il modello risponde comunque
+    no_context_answer = None
+    empty_answer = ""
+
+    def __init__(self, model=OPENAI_MODEL):
+        from langchain_openai import ChatOpenAI
+        self.model_name = model
+        # I 429 li gestisce il QueryEngine, che ne tiene conto per dosare tutte le richieste
+        self.chat_model = ChatOpenAI(model=model, max_retries=0)
+
+    @functools.cached_property
+    def _encoding(self):
+        try:
+            import tiktoken
+            return tiktoken.encoding_for_model(self.model_name)
+        except Exception:
+            return None
+
+    def count_tokens(self, text):
+        encoding = self._encoding
+        return len(encoding.encode(text)) if encoding else estimate_tokens(text)
+
+    def build_messages(self, question, context, history=""):
+        messages = [
+            {"role": "system",
+             "content": "Sei un assistente AI che risponde a domande basandoti sul contenuto di un documento."
+                        " Rispondi in modo dettagliato e preciso, approfondendo il contenuto del testo"},
+            {"role": "system", "content": f"Il documento fornisce queste informazioni rilevanti:\n{context}"},
+            {"role": "user", "content": f"Domanda: {question}"}
+        ]
+        if history:
+            messages.insert(2, {"role": "system", "content": f"Conversazione fin qui:\n{history}"})
+        return messages
+
+    def summarize(self, text, max_words):
+        messages = [{"role": "system", "content": SUMMARY_INSTRUCTIONS.format(max_words=max_words)},
+                    {"role": "user", "content": text}]
+        return self.chat_model.invoke(messages).content.strip()
+
+    async def astream(self, question, context, history=""):
+        # Il client asincrono di ChatOpenAI è unico per istanza: le connessioni HTTP vengono riutilizzate
+        async for chunk in self.chat_model.astream(self.build_messages(question, context, history)):
+            token = chunk.content if hasattr(chunk, 'content') else str(chunk)
+            if token:
+                yield token
+
+
+class HuggingFaceBackend:
+    """Generazione delle risposte con un modello servito da Hugging Face Inference."""
+
+    name = "llama"
+    library_dir = "library_LLAMA"
+    legacy_index = ("faiss_index_LLAMA", "filename_2.json")
+    retriever_k = 10
+    # Il modello 3B risponde più in fretta e meglio con un contesto breve
+    context_token_budget = 3000
+    history_token_budget = 800
+    # Embedding locali: l'app LLAMA non richiede una API key OpenAI né la rete per indicizzare
+    embeddings = "local"
+    requests_per_minute = 60
+    no_context_answer = "La domanda non è pertinente."
+    empty_answer = "Errore nella risposta del modello."
+
+    def __init__(self, model=HF_MODEL, token=None):
+        from huggingface_hub import AsyncInferenceClient, InferenceClient
+        self.model_name = model
+        token = token or os.getenv("HUGGINGFACE_API_TOKEN")
+        self._token = token
+        self.inference_client = InferenceClient(model=model, token=token)
+        self.async_client = AsyncInferenceClient(model=model, token=token)
+
+    @functools.cached_property
+    def _tokenizer(self):
+        # Il tokenizer del modello richiede transformers e, per Llama, l'accesso al repository
+        try:
+            from transformers import AutoTokenizer
+            return AutoTokenizer.from_pretrained(self.model_name, token=self._token)
+        except Exception:
+            return None
+
+    def count_tokens(self, text):
+        tokenizer = self._tokenizer
+        return len(tokenizer.encode(text, add_special_tokens=False)) if tokenizer else estimate_tokens(text)
+
+    def build_prompt(self, question, context, history=""):
+        if history:
+            # La storia segue il contesto: il modello la usa per capire domande come "e il secondo?"
+            context = f"{context}\n\n### Conversazione fin qui:\n{history}"
+        return f"""
+            <s>Source: system
+
+            Sei un assistente AI che fornisce risposte ad un utente basandoti solo ed esclusivamente sulle informazioni nel CONTESTO.
+            L'utente farà una domanda, e tu dovrai rispondere in maniera accurata ed approfondita in base a tutte le informazioni pertinenti che riuscirai a trovare nel CONTESTO.  
+            NON inventare nulla. Se non trovi informazioni rilevanti nel CONTESTO, rispondi semplicemente con:  
+            "Non ho trovato informazioni rilevanti nel documento."
+            Se l'utente ti chiede un parere personale su un argomento, rispondi giudicando l'argomento in base alle tue conoscenze e ai tuoi gusti personali, 
+            facendo riferimento, ove possibile, alle informazioni che trovi nel CONTESTO. Se non trovi nessuna informazione relativa nel CONTESTO ad una domanda personale dell'utente, rispondi
+            giudicando l'argomento in base alle tue conoscenze personali.
+
+            <step> Source: user
+
+            ### Contesto del documento:
+            {context}
+
+            <step> Source: assistant
+
+            <s>Source: user
+
+            ### Domanda dell'utente:
+            {question}
+
+            <step> Source: assistant
+            Destination: user
+            """
+
+    def summarize(self, text, max_words):
+        prompt = (f"<s>Source: system\n\n{SUMMARY_INSTRUCTIONS.format(max_words=max_words)}\n\n"
+                  f"<step> Source: user\n\n{text}\n\n<step> Source: assistant\nDestination: user\n")
+        return self.inference_client.text_generation(prompt, max_new_tokens=max_words * 2).strip()
+
+    async def astream(self, question, context, history=""):
+        stream = await self.async_client.text_generation(self.build_prompt(question, context, history),
+                                                         stream=True)
+        async for token in stream:
+            if isinstance(token, str) and token:
+                yield token
+
+
+BACKENDS = {
+    OpenAIBackend.name: OpenAIBackend,
+    HuggingFaceBackend.name: HuggingFaceBackend,
+}
+
+
+def make_backend(name, **kwargs):
+    try:
+        return BACKENDS[name](**kwargs)
+    except KeyError:
+        raise ValueError(f"Backend sconosciuto: {name}. Disponibili: {', '.join(BACKENDS)}") from None
@@ -0,0 +1,546 @@
+"""Interfaccia PyQt5 comune alle due applicazioni ChatBot.
+
+Ogni script crea una sottoclasse di ChatWindow che indica backend, titolo,
+saluto e stile; tutto il resto (thread, libreria, domande) è condiviso.
+"""
+import os
+import sys
+
+from PyQt5.QtWidgets import (QApplication, QMainWindow, QLabel, QPushButton, QWidget,
+                             QVBoxLayout, QLineEdit, QTextEdit, QFileDialog, QProgressBar,
+                             QListWidget, QListWidgetItem, QAbstractItemView, QMessageBox)
+from PyQt5.QtGui import QIcon, QFont, QTextCursor
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal
+
+from chatbot_core.client import RemoteLibrary, RemoteQueryEngine, ServerError
+from chatbot_core.indexing import PageQueue
+from chatbot_core.library import DocumentLibrary, file_hash
+from chatbot_core.metrics import metrics
+from chatbot_core.page_cache import PageTextCache
+from chatbot_core.retrieval import make_retriever
+
+# Con CHATBOT_SERVER_URL la finestra usa il server condiviso (python -m chatbot_core.server),
+# che ha la propria API Key: qui non servono né la chiave né gli indici
+SERVER_URL = os.getenv("CHATBOT_SERVER_URL")
+# Pausa nella scrittura dopo cui si cercano già i documenti per la domanda
+PREFETCH_DEBOUNCE_MS = 400
+
+
+class PdfLoaderThread(QThread):
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
+
+    def __init__(self, file_path, page_queue, page_cache=None, doc_hash=None):
+        super().__init__()
+        self.file_path = file_path
+        self.page_queue = page_queue
+        # Un PDF già letto viene ridiviso dal testo in cache, senza riaprirlo
+        self.page_cache = page_cache
+        self.doc_hash = doc_hash
+
+    def run(self):
+        from chatbot_core.pipeline import extract_pages
+        self.finished.emit(extract_pages(self.file_path, self.page_queue, self.progress.emit,
+                                         page_cache=self.page_cache, doc_hash=self.doc_hash))
+
+
+class IndexingThread(QThread):
+    # Vectorstore, oppure None con il messaggio di errore
+    finished = pyqtSignal(object, str)
+
+    def __init__(self, page_queue, library, embeddings_name, doc_hash, title, base_hash=None):
+        super().__init__()
+        self.page_queue = page_queue
+        self.library = library
+        self.embeddings_name = embeddings_name
+        self.doc_hash = doc_hash
+        self.title = title
+        # Indice di una versione precedente dello stesso PDF da aggiornare
+        self.base_hash = base_hash
+
+    def run(self):
+        from chatbot_core.embeddings import make_embeddings
+        from chatbot_core.pipeline import index_pages
+        try:
+            # Creati alla prima indicizzazione e non all'avvio: senza sentence-transformers
+            # i documenti già indicizzati restano interrogabili
+            embeddings = make_embeddings(self.embeddings_name)
+        except Exception as e:
+            # Il caricamento del PDF è già partito e non deve restare bloccato sulla coda piena
+            for _ in self.page_queue:
+                pass
+            self.fail(e)
+            return
+        try:
+            vectorstore = index_pages(self.page_queue, self.library, embeddings,
+                                      self.doc_hash, self.title, self.base_hash)
+        except Exception as e:
+            self.fail(e)
+            return
+        self.finished.emit(vectorstore, "")
+
+    def fail(self, error):
+        metrics.event("indexing_error", title=self.title, error=str(error))
+        self.finished.emit(None, str(error))
+
+
+class UploadThread(QThread):
+    # Modalità client: il PDF viene indicizzato dal server, qui si attende solo il risultato
+    finished = pyqtSignal(str, str)
+
+    def __init__(self, library, file_path, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.file_path = file_path
+
+    def run(self):
+        try:
+            self.finished.emit(self.library.upload(self.file_path), "")
+        except (OSError, ServerError) as e:
+            self.finished.emit("", str(e))
+
+
+class StartupThread(QThread):
+    # Client del modello, embedding, cache e FAISS richiedono import lenti: si caricano a finestra già aperta
+    finished = pyqtSignal()
+
+    def __init__(self, make_backend, library, parent=None):
+        super().__init__(parent)
+        self.make_backend = make_backend
+        self.library = library
+        self.backend = None
+        self.embeddings_name = None
+        self.answer_cache = None
+        self.query_engine = None
+        self.error = ""
+
+    def run(self):
+        if SERVER_URL:
+            # Modello, embedding e indici restano sul server; l'elenco dei documenti arriva qui, non nell'interfaccia
+            self.library.refresh()
+            self.query_engine = RemoteQueryEngine(SERVER_URL)
+            self.finished.emit()
+            return
+        try:
+            from chatbot_core.answer_cache import AnswerCache
+            from chatbot_core.engine import QueryEngine
+            from chatbot_core.router import make_router
+
+            # Con CHATBOT_FALLBACK le risposte lente o fallite passano ai backend di riserva
+            self.backend = make_router(self.make_backend())
+            self.embeddings_name = os.getenv("CHATBOT_EMBEDDINGS") or self.backend.embeddings
+            self.answer_cache = AnswerCache()
+            self.query_engine = QueryEngine(self.backend)
+        except Exception as e:
+            self.error = str(e)
+        self.finished.emit()
+
+
+class IndexLoaderThread(QThread):
+    # Retriever, oppure None con il messaggio di errore
+    finished = pyqtSignal(object, str)
+
+    def __init__(self, library, backend, doc_hashes, parent=None):
+        super().__init__(parent)
+        self.library = library
+        self.backend = backend
+        self.doc_hashes = doc_hashes
+
+    def run(self):
+        try:
+            # Più documenti selezionati: gli indici vengono uniti per interrogarli insieme
+            vectorstore = self.library.load_merged(self.doc_hashes)
+            retriever = make_retriever(vectorstore, self.backend, self.library.load_bm25(self.doc_hashes))
+        except Exception as e:
+            metrics.event("index_load_error", error=str(e))
+            self.finished.emit(None, str(e))
+            return
+        self.finished.emit(retriever, "")
+
+
+class QuerySignals(QObject):
+    # Ponte tra il QueryEngine, che lavora in un proprio thread, e l'interfaccia
+    token = pyqtSignal(str)
+    first_token = pyqtSignal(float)
+    cached = pyqtSignal(str, str)
+    finished = pyqtSignal(str)
+
+    def __init__(self, error_message):
+        super().__init__()
+        self.error_message = error_message
+
+    def on_done(self, answer):
+        if answer.cached:
+            self.cached.emit(answer.text, answer.question)
+        else:
+            self.finished.emit(answer.text)
+
+    def on_error(self, e):
+        self.finished.emit(f"{self.error_message}: {e}")
+
+
+class ChatWindow(QMainWindow):
+    # Impostati dalle sottoclassi di ogni applicazione
+    backend_class = None
+    window_title = "ChatBot"
+    greeting = "Ciao! Sono il tuo ChatBot e sono qui per aiutarti"
+    error_message = "Errore durante la generazione della risposta"
+    label_width = 980
+    load_button_style = "QPushButton:hover { background-color: #c2e0f4; }"
+    query_button_style = "QPushButton:hover {background-color: #c2e0f4; }"
+
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle(self.window_title)
+        self.setGeometry(250, 250, 1920, 1080)
+        self.setWindowIcon(QIcon("ChatBotIcon.PNG"))
+        self.setStyleSheet("background-color: #aed8f5")
+        self.pdf_error = ""
+        self.qa_chain = None
+        # Creati da StartupThread dopo che la finestra è stata mostrata
+        self.backend = None
+        self.embeddings_name = None
+        self.answer_cache = None
+        self.query_engine = None
+        self.index_loader_thread = None
+        self.page_cache = PageTextCache()
+        self.library = RemoteLibrary(SERVER_URL) if SERVER_URL else DocumentLibrary(self.backend_class.library_dir)
+        self.initUI()
+
+    def initUI(self):
+        self.central_widget = QWidget(self)
+        self.setCentralWidget(self.central_widget)
+        self.main_layout = QVBoxLayout(self.central_widget)
+        self.main_layout.setAlignment(Qt.AlignTop)
+
+        self.label = QLabel("Ciao! Sono il tuo ChatBot e sono qui per aiutarti", self)
+        self.label.setFont(QFont("Arial", 15))
+        self.label.setStyleSheet("background-color: #d9f2d3; border-radius: 35px;")
+        self.label.setAlignment(Qt.AlignCenter)
+        self.label.setFixedSize(self.label_width, 80)
+        self.main_layout.addWidget(self.label, alignment=Qt.AlignCenter)
+
+        # Etichetta per il titolo del PDF
+        self.pdf_title_label = QLabel("", self)  # Inizialmente vuota
+        self.pdf_title_label.setFont(QFont("Arial", 12, QFont.Bold))
+        self.pdf_title_label.setAlignment(Qt.AlignCenter)
+        self.pdf_title_label.setStyleSheet("color: #333; background-color: #fff8dc; padding: 5px; border-radius: 10px;")
+        self.pdf_title_label.setFixedSize(880, 40)  # Dimensioni fisse per il titolo
+        self.pdf_title_label.setVisible(False)  # Non visibile finché non viene caricato un PDF
+        self.main_layout.addWidget(self.pdf_title_label, alignment=Qt.AlignCenter)
+
+        # Documenti già indicizzati: selezionarne uno o più li rende interrogabili
+        self.document_list = QListWidget(self)
+        self.document_list.setFont(QFont("Arial", 11))
+        self.document_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.document_list.setStyleSheet("background-color: #fff8dc; border-radius: 10px;")
+        self.document_list.setFixedSize(880, 120)
+        self.document_list.itemSelectionChanged.connect(self.on_selection_changed)
+        self.main_layout.addWidget(self.document_list, alignment=Qt.AlignCenter)
+
+        # "Carica PDF" button
+        self.load_pdf_button = QPushButton("Carica PDF", self)
+        self.load_pdf_button.setFont(QFont("Arial", 12))
+        self.load_pdf_button.setFixedSize(200, 80)
+        self.load_pdf_button.setStyleSheet(self.load_button_style)
+        self.load_pdf_button.clicked.connect(self.load_pdf)
+        self.load_pdf_button.setEnabled(False)
+        self.main_layout.addWidget(self.load_pdf_button, alignment=Qt.AlignCenter)
+
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setMaximum(100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setVisible(False)
+        self.main_layout.addWidget(self.progress_bar)
+
+        self.input_box = QLineEdit(self)
+        self.input_box.setPlaceholderText("Scrivi qui la tua domanda...")
+        self.input_box.setFont(QFont("Arial", 14))
+        self.input_box.setStyleSheet("padding: 10px; border-radius: 10px;")
+        self.main_layout.addWidget(self.input_box)
+
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(PREFETCH_DEBOUNCE_MS)
+        self.prefetch_timer.timeout.connect(self.prefetch_retrieval)
+        self.input_box.textEdited.connect(lambda _: self.prefetch_timer.start())
+
+        self.output_box = QTextEdit(self)
+        self.output_box.setFont(QFont("Arial", 12))
+        self.output_box.setStyleSheet("padding: 10px; background-color: #f0f8ff; border-radius: 10px;")
+        self.output_box.setReadOnly(True)
+        self.main_layout.addWidget(self.output_box)
+
+        self.query_button = QPushButton("Invia", self)
+        self.query_button.setFont(QFont("Arial", 12))
+        self.query_button.setFixedSize(600, 80)
+        self.query_button.setStyleSheet(self.query_button_style)
+        self.query_button.clicked.connect(self.ask_chatbot)
+        self.main_layout.addWidget(self.query_button, alignment=Qt.AlignCenter)
+
+        # Pannello delle statistiche: tempi delle fasi, token e hit rate delle cache
+        self.stats_button = QPushButton("Statistiche", self)
+        self.stats_button.setFont(QFont("Arial", 10))
+        self.stats_button.setFixedSize(200, 40)
+        self.stats_button.clicked.connect(self.toggle_stats)
+        self.main_layout.addWidget(self.stats_button, alignment=Qt.AlignCenter)
+
+        self.stats_box = QTextEdit(self)
+        self.stats_box.setFont(QFont("Courier New", 10))
+        self.stats_box.setStyleSheet("padding: 5px; background-color: #fff8dc; border-radius: 10px;")
+        self.stats_box.setReadOnly(True)
+        self.stats_box.setFixedHeight(160)
+        self.stats_box.setVisible(False)
+        self.main_layout.addWidget(self.stats_box)
+
+        self.stats_timer = QTimer(self)
+        self.stats_timer.timeout.connect(self.refresh_stats)
+
+        self.label.setText(self.greeting)
+        self.library.import_legacy(*self.backend_class.legacy_index)
+        self.refresh_document_list()
+        self.set_ready(False)
+        self.startup_thread = StartupThread(self.make_backend, self.library, self)
+        self.startup_thread.finished.connect(self.on_startup_finished)
+        self.startup_thread.start()
+
+    def make_backend(self):
+        return self.backend_class()
+
+    def on_startup_finished(self):
+        if self.startup_thread.error:
+            self.label.setText(f"Errore durante l'avvio: {self.startup_thread.error}")
+            return
+        self.backend = self.startup_thread.backend
+        self.embeddings_name = self.startup_thread.embeddings_name
+        self.answer_cache = self.startup_thread.answer_cache
+        self.query_engine = self.startup_thread.query_engine
+        if SERVER_URL:
+            self.refresh_document_list()
+        self.load_pdf_button.setEnabled(True)
+        self.load_existing_index()
+
+    def set_ready(self, ready, text="Caricamento..."):
+        # Il pulsante si attiva solo quando client e indice sono pronti
+        self.query_button.setEnabled(ready)
+        self.query_button.setText("Invia" if ready else text)
+
+    def toggle_stats(self):
+        visible = not self.stats_box.isVisible()
+        self.stats_box.setVisible(visible)
+        if visible:
+            self.refresh_stats()
+            self.stats_timer.start(2000)
+        else:
+            self.stats_timer.stop()
+
+    def refresh_stats(self):
+        self.stats_box.setPlainText(metrics.summary_text())
+
+    def load_pdf(self):
+        file_path, _ = QFileDialog.getOpenFileName(self, "Carica PDF", "C:/Users/simo-/OneDrive/Desktop", "PDF Files (*.pdf)")
+        if file_path:
+            filename = os.path.basename(file_path)
+            doc_hash = file_hash(file_path)
+            if self.library.chunked_with(doc_hash):
+                # Documento già indicizzato con i parametri correnti: nessuna estrazione né embedding
+                self.select_documents([doc_hash])
+                self.label.setText("Documento già indicizzato! Ora puoi fare domande sul documento.")
+                return
+            if SERVER_URL:
+                self.label.setText("Attendi mentre il server elabora il pdf...")
+                self.pdf_title_label.setText(filename)
+                self.upload_thread = UploadThread(self.library, file_path, self)
+                self.upload_thread.finished.connect(self.on_upload_finished)
+                self.upload_thread.start()
+                return
+
+            self.label.setText("Attendi mentre carico il pdf e lo elaboro...")
+            self.pdf_title_label.setText(filename)
+            self.progress_bar.setVisible(True)
+            self.progress_bar.setValue(0)
+            self.pdf_error = ""
+            page_queue = PageQueue()
+            self.pdf_loader_thread = PdfLoaderThread(file_path, page_queue, self.page_cache, doc_hash)
+            self.pdf_loader_thread.progress.connect(self.progress_bar.setValue)
+            self.pdf_loader_thread.finished.connect(self.on_pdf_loaded)
+            # Probabile nuova versione di un PDF già indicizzato (o stesso PDF con altri parametri
+            # di chunking): si calcolano solo gli embedding dei chunk cambiati
+            base_hash = self.library.find_by_title(filename)
+            self.indexing_thread = IndexingThread(page_queue, self.library, self.embeddings_name, doc_hash, filename, base_hash)
+            self.indexing_thread.finished.connect(self.on_indexing_finished)
+            self.pdf_loader_thread.start()
+            self.indexing_thread.start()
+
+    def on_upload_finished(self, doc_hash, error):
+        if error:
+            self.label.setText(error)
+            return
+        self.label.setText("Indice creato! Ora puoi fare domande sul documento.")
+        self.select_documents([doc_hash])
+
+    def on_pdf_loaded(self, error):
+        self.progress_bar.setVisible(False)
+        self.pdf_error = error
+        if error:
+            self.label.setText(error)
+        else:
+            self.label.setText("PDF caricato! Attendi prima che elabori il documento...")
+            self.pdf_title_label.setVisible(True)
+
+    def on_indexing_finished(self, vectorstore, error):
+        if vectorstore:
+            self.label.setText("Indice creato! Ora puoi fare domande sul documento.")
+            base_hash = self.indexing_thread.base_hash
+            if base_hash and base_hash != self.indexing_thread.doc_hash and base_hash in self.library:
+                self.ask_remove_previous_version(base_hash)
+            self.library.select([self.indexing_thread.doc_hash])
+            self.refresh_document_list()
+            # Un caricamento dell'indice ancora in corso non deve sostituire quello appena creato
+            self.index_loader_thread = None
+            # Nuovo documento, nuova conversazione
+            self.query_engine.reset_session("gui")
+            self.set_ready(True)
+            self.qa_chain = make_retriever(vectorstore, self.backend,
+                                           self.library.load_bm25([self.indexing_thread.doc_hash]))
+        elif not self.pdf_error:
+            self.label.setText(f"Errore nella creazione dell'indice: {error}" if error
+                               else "Errore nella creazione dell'indice.")
+
+    def ask_remove_previous_version(self, base_hash):
+        # Lo stesso nome non basta a dire che è lo stesso documento (Lezione1.pdf di due corsi): decide l'utente
+        title = self.library.get(base_hash)["title"]
+        answer = QMessageBox.question(
+            self, "Versione precedente",
+            f"Nella libreria c'è già un documento {title}. È una versione precedente di questo PDF da eliminare?",
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if answer == QMessageBox.Yes:
+            self.library.remove(base_hash)
+            # Testo e OCR della versione eliminata non servono più
+            self.page_cache.remove(base_hash)
+
+    def refresh_document_list(self):
+        self.document_list.blockSignals(True)
+        self.document_list.clear()
+        selected = self.library.selected
+        for entry in self.library.documents():
+            item = QListWidgetItem(f"{entry['title']}  ({entry['num_pages'] or '?'} pagine)")
+            item.setData(Qt.UserRole, entry["hash"])
+            self.document_list.addItem(item)
+            item.setSelected(entry["hash"] in selected)
+        self.document_list.blockSignals(False)
+
+        titles = [self.library.get(doc_hash)["title"] for doc_hash in selected]
+        self.pdf_title_label.setText(", ".join(titles))
+        self.pdf_title_label.setVisible(bool(titles))
+
+    def select_documents(self, doc_hashes):
+        self.library.select(doc_hashes)
+        self.refresh_document_list()
+        self.load_existing_index()
+
+    def on_selection_changed(self):
+        doc_hashes = [item.data(Qt.UserRole) for item in self.document_list.selectedItems()]
+        if doc_hashes != self.library.selected:
+            self.select_documents(doc_hashes)
+
+    def load_existing_index(self):
+        self.qa_chain = None
+        self.index_loader_thread = None
+        if self.query_engine is None:
+            # Avvio ancora in corso: on_startup_finished caricherà la selezione corrente
+            return
+        # Le domande di seguito si riferiscono ai documenti selezionati prima
+        self.query_engine.reset_session("gui")
+        selected = self.library.selected
+        if not selected:
+            self.set_ready(True)
+            return
+        if SERVER_URL:
+            # Gli indici sono caricati sul server: alle domande basta indicare i documenti
+            self.qa_chain = selected
+            self.set_ready(True)
+            return
+        self.set_ready(False, "Caricamento indice...")
+        self.index_loader_thread = IndexLoaderThread(self.library, self.backend, selected, self)
+        self.index_loader_thread.finished.connect(self.on_index_loaded)
+        self.index_loader_thread.start()
+
+    def on_index_loaded(self, retriever, error):
+        # Il risultato di una selezione nel frattempo cambiata viene ignorato
+        if self.sender() is not self.index_loader_thread:
+            return
+        if error:
+            self.label.setText(f"Errore nel caricamento dell'indice: {error}")
+        self.qa_chain = retriever
+        self.set_ready(True)
+
+    def prefetch_retrieval(self):
+        # All'invio i documenti di una domanda uguale o quasi sono già pronti
+        if self.query_engine is None or self.qa_chain is None:
+            return
+        self.query_engine.prefetch(self.input_box.text().strip(), self.qa_chain,
+                                   ",".join(sorted(self.library.selected)), session="gui")
+
+    def ask_chatbot(self):
+        self.prefetch_timer.stop()
+        user_input = self.input_box.text().strip()
+
+        if not user_input:
+            self.output_box.setText("Per favore, scrivi una domanda.")
+            return
+
+        self.output_box.setText("Sto elaborando la risposta...")
+        self.answer_started = False
+        QApplication.processEvents()
+
+        if self.qa_chain is None:
+            self.output_box.setText("Non ho nessun file caricato. Per favore, carica un PDF.")
+            return
+
+        # Una nuova domanda annulla quella precedente ancora in corso
+        self.query_signals = QuerySignals(self.error_message)
+        self.query_signals.token.connect(self.on_answer_token)
+        self.query_signals.first_token.connect(self.on_first_token)
+        self.query_signals.cached.connect(self.on_cached_answer)
+        self.query_signals.finished.connect(self.on_answer_finished)
+        self.query_engine.submit(user_input, self.qa_chain, self.answer_cache, ",".join(sorted(self.library.selected)),
+                                 session="gui", on_token=self.query_signals.token.emit,
+                                 on_first_token=self.query_signals.first_token.emit,
+                                 on_done=self.query_signals.on_done, on_error=self.query_signals.on_error)
+
+    def is_current_query(self):
+        # I segnali di una domanda sostituita possono arrivare ancora dopo l'annullamento
+        return self.sender() is self.query_signals
+
+    def on_answer_token(self, token):
+        if not self.is_current_query():
+            return
+        # Al primo token si sostituisce il messaggio di attesa con la risposta in arrivo
+        if not self.answer_started:
+            self.answer_started = True
+            self.output_box.clear()
+        self.output_box.moveCursor(QTextCursor.End)
+        self.output_box.insertPlainText(token)
+
+    def on_first_token(self, seconds):
+        if not self.is_current_query():
+            return
+        self.statusBar().showMessage(f"Prima parte della risposta ricevuta in {seconds:.2f} s")
+
+    def on_answer_finished(self, text):
+        if self.is_current_query():
+            self.output_box.setText(text)
+
+    def on_cached_answer(self, answer, question):
+        if not self.is_current_query():
+            return
+        self.output_box.setText(f"[Risposta dalla cache]\n\n{answer}")
+        self.statusBar().showMessage(f"Risposta riutilizzata dalla domanda: \"{question}\"")
+
+
+def run(window_class):
+    app = QApplication(sys.argv)
+    window = window_class()
+    window.show()
+    sys.exit(app.exec_())
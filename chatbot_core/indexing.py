@@ -0,0 +1,309 @@
+import hashlib
+import os
+import queue
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from chatbot_core.errors import is_too_large, is_transient
+from chatbot_core.metrics import metrics
+
+CHUNK_SIZE = int(os.getenv("CHATBOT_CHUNK_SIZE", "2000"))
+CHUNK_OVERLAP = int(os.getenv("CHATBOT_CHUNK_OVERLAP", "200"))
+# Dividere una pagina costa meno di un decimo di millisecondo, avviare un processo con LangChain
+# più di mezzo secondo: i processi servono solo per documenti con migliaia di pagine
+CHUNK_WORKERS = os.cpu_count() or 1
+CHUNK_PARALLEL_MIN_PAGES = 2000
+CHUNK_BLOCK_PAGES = 256
+HEADING_MAX_CHARS = 80
+HEADING_PATTERN = re.compile(r"^(\d+(\.\d+)*\.?\s+\S|(capitolo|sezione|parte|appendice|chapter|section)\b)", re.I)
+EMBEDDING_BATCH_SIZE = 64
+# Limite prudente di token per richiesta (OpenAI ne accetta fino a 300k) e richieste contemporanee
+EMBEDDING_MAX_TOKENS = 100_000
+EMBEDDING_WORKERS = int(os.getenv("CHATBOT_EMBEDDING_WORKERS", "4"))
+EMBEDDING_RETRIES = 3
+# Pagine in attesa tra estrazione e indicizzazione: limita la memoria se l'embedding è più lento del parsing
+PAGE_QUEUE_SIZE = 32
+
+
+class PageQueue:
+    """Coda di pagine tra il thread che legge il PDF e quello che lo indicizza."""
+
+    _END = object()
+
+    def __init__(self, maxsize=PAGE_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.pages_read = 0
+        self.aborted = False
+
+    def put(self, text):
+        self._queue.put(text)
+
+    def abort(self):
+        # La lettura è fallita: le pagine ricevute non vanno salvate come indice
+        self.aborted = True
+
+    def close(self):
+        self._queue.put(self._END)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._END:
+                return
+            self.pages_read += 1
+            yield item
+
+
+def make_splitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def _locate(buffer, pieces, start):
+    # Posizione di ogni chunk nel buffer, per conservare l'offset nel documento
+    positions = []
+    for piece in pieces:
+        pos = buffer.find(piece, start)
+        if pos < 0:
+            pos = start
+        positions.append(pos)
+        start = pos + 1
+    return positions
+
+
+def find_headings(text):
+    """Titoli riconosciuti nel testo di una pagina, come lista di (offset, titolo).
+
+    Sono righe brevi senza punteggiatura finale che iniziano con una
+    numerazione ("2.1 Metodo", "Capitolo 3") o sono scritte in maiuscolo.
+    """
+    headings = []
+    offset = 0
+    for line in text.splitlines(keepends=True):
+        stripped = line.strip()
+        if (3 <= len(stripped) <= HEADING_MAX_CHARS and stripped[-1] not in ".,;:"
+                and (HEADING_PATTERN.match(stripped) or (stripped.isupper() and any(c.isalpha() for c in stripped)))):
+            headings.append((offset, stripped))
+        offset += len(line)
+    return headings
+
+
+def split_page_block(texts, chunk_size, chunk_overlap):
+    # Eseguita nei processi worker per i documenti molto lunghi
+    splitter = make_splitter(chunk_size, chunk_overlap)
+    return [splitter.split_text(text) for text in texts]
+
+
+def _iter_split_pages(pages, splitter, workers):
+    """Coppie (testo, chunk) di ogni pagina, nell'ordine delle pagine.
+
+    Le pagine si dividono in modo indipendente: oltre CHUNK_PARALLEL_MIN_PAGES
+    pagine le successive vengono divise a blocchi in più processi.
+    """
+    pool = None
+    pending = deque()
+    block = []
+    try:
+        for count, text in enumerate(pages, 1):
+            if pool is None and (workers <= 1 or count <= CHUNK_PARALLEL_MIN_PAGES):
+                with metrics.span("chunking", log=False):
+                    pieces = splitter.split_text(text)
+                yield text, pieces
+                continue
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=workers)
+            block.append(text)
+            if len(block) == CHUNK_BLOCK_PAGES:
+                pending.append((block, pool.submit(split_page_block, block, splitter._chunk_size,
+                                                   splitter._chunk_overlap)))
+                block = []
+                while len(pending) >= workers * 2:
+                    texts, future = pending.popleft()
+                    yield from zip(texts, future.result())
+        if block:
+            pending.append((block, pool.submit(split_page_block, block, splitter._chunk_size,
+                                               splitter._chunk_overlap)))
+        while pending:
+            texts, future = pending.popleft()
+            yield from zip(texts, future.result())
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_chunks(pages, splitter=None, workers=1):
+    """Divide in chunk un flusso di pagine man mano che arrivano, una pagina alla volta.
+
+    Ogni chunk appartiene a una sola pagina, così si può citare e filtrare per
+    pagina. Restituisce tuple (testo, metadata) con la pagina (da 1), l'offset
+    nel documento e nella pagina e l'ultimo titolo che precede il chunk.
+    """
+    splitter = splitter or make_splitter()
+    doc_offset = 0
+    heading = ""
+    for page, (text, pieces) in enumerate(_iter_split_pages(pages, splitter, workers), 1):
+        headings = find_headings(text)
+        next_heading = 0
+        for piece, pos in zip(pieces, _locate(text, pieces, 0)):
+            while next_heading < len(headings) and headings[next_heading][0] <= pos:
+                heading = headings[next_heading][1]
+                next_heading += 1
+            yield piece, {
+                "start_index": doc_offset + pos,
+                "page": page,
+                "page_end": page,
+                "page_start_index": pos,
+                "heading": heading,
+            }
+        if headings:
+            heading = headings[-1][1]
+        doc_offset += len(text)
+
+
+def iter_chunk_ids(chunks, doc_id):
+    """Associa a ogni chunk un id stabile: documento, hash del testo e pagine coperte.
+
+    Il prefisso doc_id tiene distinti i chunk uguali di documenti diversi
+    interrogati insieme; il resto dell'id (chunk_content_key) è lo stesso per
+    lo stesso chunk riletto da una nuova versione del PDF, così
+    l'aggiornamento incrementale riconosce cosa è cambiato.
+    """
+    seen = {}
+    for text, metadata in chunks:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+        key = f"{digest}:{metadata['page']}-{metadata['page_end']}"
+        # Chunk identici nelle stesse pagine: numerati per non avere id duplicati
+        seen[key] = seen.get(key, 0) + 1
+        if seen[key] > 1:
+            key = f"{key}#{seen[key]}"
+        yield f"{doc_id}:{key}", text, metadata
+
+
+def chunk_content_key(chunk_id):
+    """La parte dell'id che dipende solo dal contenuto (anche per gli id senza documento degli indici meno recenti)."""
+    return chunk_id.split(":", 1)[1] if chunk_id.count(":") > 1 else chunk_id
+
+
+def estimate_tokens(text):
+    # Stima per eccesso: testi italiani e formule hanno meno caratteri per token dell'inglese
+    return len(text) // 3 + 1
+
+
+def iter_token_batches(chunks, max_tokens=EMBEDDING_MAX_TOKENS, max_size=EMBEDDING_BATCH_SIZE):
+    """Raggruppa i chunk (id, testo, metadata) rispettando i limiti di token e di input per richiesta."""
+    batch = []
+    tokens = 0
+    for item in chunks:
+        item_tokens = estimate_tokens(item[1])
+        if batch and (len(batch) == max_size or tokens + item_tokens > max_tokens):
+            yield batch
+            batch = []
+            tokens = 0
+        batch.append(item)
+        tokens += item_tokens
+    if batch:
+        yield batch
+
+
+def embed_with_retry(embeddings, texts, retries=EMBEDDING_RETRIES):
+    """Calcola gli embedding di un blocco ripetendo la richiesta se fallisce per un errore temporaneo.
+
+    Se il blocco supera il limite di token, o continua a fallire, viene diviso
+    a metà e ogni parte ritentata da sola, così un chunk problematico non fa
+    perdere il resto del lavoro. Gli altri errori sono propagati subito.
+    """
+    for attempt in range(retries):
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            too_large = is_too_large(e)
+            if not too_large and not is_transient(e):
+                raise
+            if too_large or attempt == retries - 1:
+                if len(texts) == 1:
+                    raise
+                metrics.event("embedding_batch_split", chunks=len(texts), error=str(e))
+                half = len(texts) // 2
+                return (embed_with_retry(embeddings, texts[:half], retries)
+                        + embed_with_retry(embeddings, texts[half:], retries))
+            time.sleep(2 ** attempt)
+
+
+def _embed_batch(embeddings, texts):
+    with metrics.span("embedding_batch", log=False):
+        vectors = embed_with_retry(embeddings, texts)
+    metrics.observe("embedding_batch_tokens", sum(estimate_tokens(text) for text in texts), log=False)
+    return vectors
+
+
+def embed_batches(batches, embeddings, workers=EMBEDDING_WORKERS):
+    """Invia più blocchi in parallelo e restituisce (blocco, vettori) nell'ordine di arrivo dei blocchi.
+
+    Ogni blocco completato finisce nella cache degli embedding: se l'indicizzazione
+    si interrompe, al caricamento successivo si riparte dai vettori già calcolati.
+    """
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        pending = deque()
+        for batch in batches:
+            pending.append((batch, pool.submit(_embed_batch, embeddings, [text for _, text, _ in batch])))
+            # Pochi blocchi in attesa: la memoria resta limitata anche con documenti enormi
+            if len(pending) >= workers * 2:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
+
+
+def _add_batch(vectorstore, batch, vectors, embeddings):
+    ids = [chunk_id for chunk_id, _, _ in batch]
+    texts = [text for _, text, _ in batch]
+    metadatas = [metadata for _, _, metadata in batch]
+    if vectorstore is None:
+        from langchain_community.vectorstores import FAISS
+        return FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+    vectorstore.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+    return vectorstore
+
+
+def build_index_streaming(chunks, embeddings, doc_id, workers=EMBEDDING_WORKERS):
+    """Calcola gli embedding a blocchi mentre i chunk vengono prodotti.
+
+    Restituisce il vectorstore FAISS, oppure None se non c'è alcun chunk.
+    """
+    vectorstore = None
+    for batch, vectors in embed_batches(iter_token_batches(iter_chunk_ids(chunks, doc_id)), embeddings, workers):
+        vectorstore = _add_batch(vectorstore, batch, vectors, embeddings)
+    return vectorstore
+
+
+def update_index(base, chunks, embeddings, doc_id, workers=EMBEDDING_WORKERS):
+    """Crea l'indice della nuova versione di un documento partendo da quello della precedente.
+
+    Vengono calcolati gli embedding solo dei chunk nuovi o modificati; per
+    gli altri si riusano i vettori di base (indice flat), con gli id e i
+    metadata della nuova versione. base non viene modificato. Restituisce il
+    nuovo vectorstore e il numero di chunk aggiunti e rimossi.
+    """
+    positions = {chunk_content_key(chunk_id): i for i, chunk_id in base.index_to_docstore_id.items()}
+    kept = []
+
+    def new_chunks():
+        for item in iter_chunk_ids(chunks, doc_id):
+            position = positions.get(chunk_content_key(item[0]))
+            if position is None:
+                yield item
+            else:
+                kept.append((item, base.index.reconstruct(position).tolist()))
+
+    vectorstore = None
+    added = 0
+    for batch, vectors in embed_batches(iter_token_batches(new_chunks()), embeddings, workers):
+        vectorstore = _add_batch(vectorstore, batch, vectors, embeddings)
+        added += len(batch)
+    for start in range(0, len(kept), EMBEDDING_BATCH_SIZE):
+        part = kept[start:start + EMBEDDING_BATCH_SIZE]
+        vectorstore = _add_batch(vectorstore, [item for item, _ in part], [vector for _, vector in part], embeddings)
+    return vectorstore, added, len(positions) - len(kept)
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from chatbot_core.indexing import CHUNK_OVERLAP, CHUNK_SIZE
+from chatbot_core.metrics import metrics
+from chatbot_core.retrieval import BM25_FILE, BM25Index
+
+MANIFEST_NAME = "manifest.json"
+# Modello predefinito di OpenAIEmbeddings, usato dagli indici delle versioni precedenti
+LEGACY_EMBEDDING_MODEL = "OpenAIEmbeddings:text-embedding-ada-002"
+# flat: IndexFlat con docstore pickle; hnsw / ivfpq: indice compatto mappato da disco; auto: sceglie in base alla dimensione
+INDEX_FORMATS = ("flat", "hnsw", "ivfpq", "auto")
+DEFAULT_INDEX_FORMAT = "flat"
+# Gli indici creati prima della scelta del backend usavano sempre OpenAI
+DEFAULT_EMBEDDINGS = "openai"
+
+
+def file_hash(file_path):
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class DocumentLibrary:
+    """Raccolta di indici FAISS, uno per PDF, identificati dall'hash del file.
+
+    Il manifest tiene titolo, pagine, chunk e modello di embedding di ogni
+    documento, oltre ai documenti selezionati per le domande. Ogni indice
+    viene sempre interrogato con gli embedding con cui è stato creato.
+    Aprire la libreria legge solo il manifest: FAISS e gli embedding
+    vengono importati al primo caricamento di un indice. Letture e scritture
+    del manifest passano da un lock: il server lo usa da più thread.
+    """
+
+    def __init__(self, root, index_format=None):
+        self.root = root
+        self.index_format = index_format or os.getenv("CHATBOT_INDEX_FORMAT") or DEFAULT_INDEX_FORMAT
+        if self.index_format not in INDEX_FORMATS:
+            raise ValueError(f"Formato di indice non valido: {self.index_format}")
+        os.makedirs(root, exist_ok=True)
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self.manifest = {"documents": {}, "selected": []}
+        self._lock = threading.RLock()
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                self.manifest.update(json.load(f))
+
+    def _save_manifest(self):
+        tmp_path = self.manifest_path + ".tmp"
+        with self._lock, open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, self.manifest_path)
+
+    def index_path(self, doc_hash):
+        return os.path.join(self.root, doc_hash)
+
+    def __contains__(self, doc_hash):
+        return doc_hash in self.manifest["documents"]
+
+    def get(self, doc_hash):
+        return self.manifest["documents"].get(doc_hash)
+
+    def documents(self):
+        """Documenti indicizzati, dal più recente."""
+        with self._lock:
+            entries = [dict(entry, hash=doc_hash) for doc_hash, entry in self.manifest["documents"].items()]
+        return sorted(entries, key=lambda entry: entry.get("indexed_at", 0), reverse=True)
+
+    def find_by_title(self, title):
+        """Versione indicizzata più recente di un documento con lo stesso titolo."""
+        for entry in self.documents():
+            if entry["title"] == title:
+                return entry["hash"]
+        return None
+
+    @property
+    def selected(self):
+        with self._lock:
+            return [doc_hash for doc_hash in self.manifest["selected"] if doc_hash in self]
+
+    def select(self, doc_hashes):
+        with self._lock:
+            self.manifest["selected"] = [doc_hash for doc_hash in doc_hashes if doc_hash in self]
+            self._save_manifest()
+
+    def add(self, doc_hash, vectorstore, title, num_pages, num_chunks, embedding_model, embeddings_name,
+            chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        from chatbot_core.compact_index import choose_format, save_compact
+        index_format = choose_format(self.index_format, vectorstore.index.ntotal)
+        with metrics.span("index_save", format=index_format):
+            if index_format == "flat":
+                vectorstore.save_local(self.index_path(doc_hash))
+            else:
+                save_compact(vectorstore, self.index_path(doc_hash), index_format)
+        BM25Index.from_vectorstore(vectorstore).save(os.path.join(self.index_path(doc_hash), BM25_FILE))
+        with self._lock:
+            self.manifest["documents"][doc_hash] = {
+                "title": title,
+                "num_pages": num_pages,
+                "num_chunks": num_chunks,
+                "embedding_model": embedding_model,
+                "embeddings": embeddings_name,
+                "index_format": index_format,
+                "chunk_size": chunk_size,
+                "chunk_overlap": chunk_overlap,
+                "indexed_at": time.time(),
+            }
+            self._save_manifest()
+
+    def remove(self, doc_hash):
+        with self._lock:
+            self.manifest["documents"].pop(doc_hash, None)
+            self.select([h for h in self.manifest["selected"] if h != doc_hash])
+        shutil.rmtree(self.index_path(doc_hash), ignore_errors=True)
+
+    def embeddings_name(self, doc_hash):
+        return self.get(doc_hash).get("embeddings", DEFAULT_EMBEDDINGS)
+
+    def chunked_with(self, doc_hash, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+        """True se il documento è indicizzato con questi parametri (gli indici precedenti vanno ridivisi)."""
+        entry = self.get(doc_hash)
+        return (entry is not None and entry.get("chunk_size") == chunk_size
+                and entry.get("chunk_overlap") == chunk_overlap)
+
+    def stored_format(self, doc_hash):
+        return self.get(doc_hash).get("index_format", "flat")
+
+    def load(self, doc_hash):
+        from langchain_community.vectorstores import FAISS
+
+        from chatbot_core.compact_index import load_compact
+        from chatbot_core.embeddings import make_embeddings
+
+        embeddings = make_embeddings(self.embeddings_name(doc_hash))
+        index_format = self.stored_format(doc_hash)
+        with metrics.span("index_load", format=index_format):
+            if index_format != "flat":
+                return load_compact(self.index_path(doc_hash), embeddings)
+            return FAISS.load_local(self.index_path(doc_hash), embeddings, allow_dangerous_deserialization=True)
+
+    def load_merged(self, doc_hashes):
+        """Unisce gli indici dei documenti indicati in un unico vectorstore.
+
+        Gli indici compatti non vengono copiati in memoria: sono interrogati
+        separatamente e i risultati uniti per distanza. Lo stesso vale per
+        gli indici creati prima degli id per documento che hanno chunk in
+        comune, che merge_from rifiuterebbe a unione già iniziata.
+        """
+        names = {self.embeddings_name(doc_hash) for doc_hash in doc_hashes}
+        if len(names) > 1:
+            raise ValueError("I documenti selezionati usano embedding diversi e non possono essere interrogati insieme.")
+        vectorstores = [self.load(doc_hash) for doc_hash in doc_hashes]
+        if not vectorstores:
+            return None
+        ids = [chunk_id for vectorstore in vectorstores for chunk_id in vectorstore.index_to_docstore_id.values()]
+        if len(vectorstores) > 1 and (any(self.stored_format(doc_hash) != "flat" for doc_hash in doc_hashes)
+                                      or len(set(ids)) < len(ids)):
+            from chatbot_core.compact_index import VectorStoreGroup
+            return VectorStoreGroup(vectorstores)
+        vectorstore = vectorstores[0]
+        for current in vectorstores[1:]:
+            vectorstore.merge_from(current)
+        return vectorstore
+
+    def load_bm25(self, doc_hashes):
+        """Indice BM25 dei documenti indicati, calcolato e salvato se manca (indici precedenti)."""
+        merged = BM25Index()
+        for doc_hash in doc_hashes:
+            path = os.path.join(self.index_path(doc_hash), BM25_FILE)
+            if os.path.exists(path):
+                current = BM25Index.load(path)
+            else:
+                current = BM25Index.from_vectorstore(self.load(doc_hash))
+                current.save(path)
+            merged.merge(current)
+        return merged
+
+    def import_legacy(self, index_path, filename_path):
+        """Importa l'indice singolo delle versioni precedenti (faiss_index_* e filename_*.json)."""
+        if self.manifest["documents"] or not os.path.exists(index_path):
+            return None
+        title = "Documento precedente"
+        try:
+            with open(filename_path, "r") as f:
+                title = json.load(f).get("filename", title)
+        except (OSError, ValueError):
+            pass
+        doc_hash = "legacy-" + hashlib.sha256(title.encode("utf-8")).hexdigest()
+        shutil.copytree(index_path, self.index_path(doc_hash), dirs_exist_ok=True)
+        self.manifest["documents"][doc_hash] = {
+            "title": title,
+            "num_pages": None,
+            "num_chunks": None,
+            "embedding_model": LEGACY_EMBEDDING_MODEL,
+            "embeddings": "openai",
+            "indexed_at": os.path.getmtime(index_path),
+        }
+        self.manifest["selected"] = [doc_hash]
+        self._save_manifest()
+        return doc_hash
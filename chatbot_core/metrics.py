@@ -0,0 +1,167 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Log JSON di eventi e misure (una riga per evento) e file di testo nel formato di Prometheus
+METRICS_LOG = os.getenv("CHATBOT_METRICS_LOG", "metrics.jsonl")
+METRICS_FILE = os.getenv("CHATBOT_METRICS_FILE", "metrics.prom")
+# Campioni recenti conservati per i percentili di ogni misura
+SAMPLES = 1024
+QUANTILES = (0.5, 0.95)
+
+
+def _quantile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _labels_text(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    """Durate delle fasi, conteggi di token e contatori (ad esempio hit e miss delle cache).
+
+    Ogni misura viene aggregata in memoria (numero, somma, massimo e
+    percentili sugli ultimi campioni) e, se richiesto, scritta come riga JSON
+    nel log. export() riscrive il file nel formato testuale di Prometheus.
+    Thread-safe: viene usato da GUI, thread di indicizzazione ed engine.
+    """
+
+    def __init__(self, log_path=METRICS_LOG, prom_path=METRICS_FILE):
+        self.log_path = log_path
+        self.prom_path = prom_path
+        self._lock = threading.Lock()
+        self._summaries = {}
+        self._counters = {}
+
+    def _write_log(self, record):
+        if not self.log_path:
+            return
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+    def event(self, name, **fields):
+        """Scrive nel log un evento che non è una misura (errori, tentativi, aggiornamenti)."""
+        self._write_log(dict(ts=time.time(), event=name, **fields))
+
+    def observe(self, name, value, log=True, fields=None, **labels):
+        """Registra un valore; le labels distinguono le serie, i fields finiscono solo nel log."""
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = {"count": 0, "sum": 0.0, "max": 0.0,
+                                                  "samples": deque(maxlen=SAMPLES)}
+            summary["count"] += 1
+            summary["sum"] += value
+            summary["max"] = max(summary["max"], value)
+            summary["samples"].append(value)
+        if log:
+            self._write_log(dict(ts=time.time(), metric=name, value=value, **labels, **(fields or {})))
+
+    @contextmanager
+    def span(self, name, log=True, **labels):
+        """Misura la durata del blocco in secondi come name_seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(f"{name}_seconds", time.perf_counter() - start, log, **labels)
+
+    def count(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def counter(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def quantile(self, name, q, min_samples=1, **labels):
+        """Percentile q degli ultimi campioni di una misura, None se ne ha meno di min_samples."""
+        with self._lock:
+            summary = self._summaries.get((name, tuple(sorted(labels.items()))))
+            samples = list(summary["samples"]) if summary is not None else []
+        return _quantile(samples, q) if samples and len(samples) >= min_samples else None
+
+    def hit_rate(self, prefix):
+        """Frazione di hit di una cache contata con prefix_hits e prefix_misses, None senza richieste."""
+        hits = self.counter(f"{prefix}_hits")
+        total = hits + self.counter(f"{prefix}_misses")
+        return hits / total if total else None
+
+    def snapshot(self):
+        with self._lock:
+            summaries = {key: dict(summary, samples=list(summary["samples"]))
+                         for key, summary in self._summaries.items()}
+            counters = dict(self._counters)
+        result = {"summaries": [], "counters": []}
+        for (name, labels), summary in sorted(summaries.items()):
+            entry = {"name": name, "labels": dict(labels), "count": summary["count"], "sum": summary["sum"],
+                     "max": summary["max"]}
+            for q in QUANTILES:
+                entry[f"p{int(q * 100)}"] = _quantile(summary["samples"], q)
+            result["summaries"].append(entry)
+        for (name, labels), value in sorted(counters.items()):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return result
+
+    def prometheus_text(self):
+        snapshot = self.snapshot()
+        lines = []
+        typed = set()
+        for entry in snapshot["summaries"]:
+            name = f"chatbot_{entry['name']}"
+            labels = sorted(entry["labels"].items())
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} summary")
+            for q in QUANTILES:
+                text = _labels_text(labels + [("quantile", q)])
+                lines.append(f"{name}{{{text}}} {entry[f'p{int(q * 100)}']}")
+            suffix = f"{{{_labels_text(labels)}}}" if labels else ""
+            lines.append(f"{name}_sum{suffix} {entry['sum']}")
+            lines.append(f"{name}_count{suffix} {entry['count']}")
+        for entry in snapshot["counters"]:
+            name = f"chatbot_{entry['name']}_total"
+            labels = sorted(entry["labels"].items())
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            suffix = f"{{{_labels_text(labels)}}}" if labels else ""
+            lines.append(f"{name}{suffix} {entry['value']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """Riscrive il file per Prometheus (node_exporter textfile o lettura diretta)."""
+        if not self.prom_path:
+            return
+        tmp_path = self.prom_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, self.prom_path)
+
+    def summary_text(self):
+        """Riepilogo breve per il pannello delle statistiche dell'interfaccia."""
+        lines = []
+        for entry in self.snapshot()["summaries"]:
+            labels = "".join(f" [{value}]" for value in entry["labels"].values())
+            if entry["name"].endswith("_seconds"):
+                lines.append(f"{entry['name'][:-8]}{labels}: p50 {entry['p50'] * 1000:.0f} ms, "
+                             f"p95 {entry['p95'] * 1000:.0f} ms ({entry['count']})")
+            else:
+                lines.append(f"{entry['name']}{labels}: media {entry['sum'] / entry['count']:.0f}, "
+                             f"max {entry['max']:.0f} ({entry['count']})")
+        for prefix in ("answer_cache", "embedding_cache"):
+            rate = self.hit_rate(prefix)
+            if rate is not None:
+                lines.append(f"{prefix} hit rate: {rate * 100:.0f}%")
+        return "\n".join(lines) or "Nessuna misura ancora disponibile."
+
+
+# Registro condiviso da tutti i moduli del processo
+metrics = Metrics()
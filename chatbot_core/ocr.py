@@ -0,0 +1,117 @@
+import functools
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF: rasterizza le pagine e chiama Tesseract
+
+from chatbot_core.metrics import metrics
+
+OCR_ENABLED = os.getenv("CHATBOT_OCR", "1") != "0"
+OCR_DPI = int(os.getenv("CHATBOT_OCR_DPI", "300"))
+# Lingue di Tesseract (servono i relativi file .traineddata)
+OCR_LANGUAGE = os.getenv("CHATBOT_OCR_LANGUAGE", "ita+eng")
+OCR_WORKERS = int(os.getenv("CHATBOT_OCR_WORKERS", "0")) or os.cpu_count() or 1
+# Pagine con meno caratteri di così sono considerate scansioni
+OCR_MIN_CHARS = 20
+# Sotto questa quota di caratteri leggibili il livello di testo è spazzatura (font senza mappa Unicode)
+OCR_MIN_READABLE_RATIO = 0.7
+READABLE_PUNCTUATION = set(".,;:!?'\"()[]{}-–—_/\\%&+*=<>«»“”‘’…€$°#@|")
+
+
+@functools.lru_cache(maxsize=None)
+def ocr_available(language=OCR_LANGUAGE):
+    """True se l'OCR è attivo e Tesseract è installato con tutte le lingue di language."""
+    if not OCR_ENABLED:
+        return False
+    try:
+        tessdata = fitz.get_tessdata()
+    except RuntimeError:
+        return False
+    missing = [lang for lang in language.split("+")
+               if not os.path.exists(os.path.join(tessdata, f"{lang}.traineddata"))]
+    if missing:
+        metrics.event("ocr_language_missing", tessdata=tessdata, languages=",".join(missing))
+        return False
+    return True
+
+
+def needs_ocr(text):
+    """True se la pagina non ha testo o ne ha uno illeggibile: va letta con l'OCR."""
+    text = text.strip()
+    if len(text) < OCR_MIN_CHARS:
+        return True
+    readable = sum(c.isalnum() or c.isspace() or c in READABLE_PUNCTUATION for c in text)
+    return readable / len(text) < OCR_MIN_READABLE_RATIO
+
+
+def ocr_page(file_path, page_number, dpi, language):
+    # Eseguita nei processi worker: un thread di Tesseract per processo, il parallelismo viene dal pool
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    start = time.perf_counter()
+    with fitz.open(file_path) as doc:
+        page = doc[page_number]
+        textpage = page.get_textpage_ocr(dpi=dpi, language=language, full=True)
+        text = page.get_text(textpage=textpage)
+    return text, time.perf_counter() - start
+
+
+def with_ocr(pages, file_path, dpi=OCR_DPI, language=OCR_LANGUAGE, workers=OCR_WORKERS,
+             page_cache=None, doc_hash=None):
+    """Restituisce le pagine di pages con il testo delle pagine scansionate letto dall'OCR.
+
+    Solo le pagine con immagini e senza testo leggibile vengono rasterizzate
+    e passate a Tesseract, in un pool di processi; le altre passano senza
+    costi. Una pagina su cui l'OCR fallisce mantiene il livello di testo del
+    PDF. Con page_cache i risultati sono salvati per (hash del file, pagina,
+    dpi) e una nuova lettura dello stesso PDF non ripete l'OCR. Le pagine escono in ordine.
+    """
+    pool = None
+    doc = None
+    pending = deque()
+    # Pagine lette in anticipo mentre l'OCR della prima in coda è in corso
+    max_pending = workers * 4
+    try:
+        for i, num_pages, text in pages:
+            ocr = None
+            if needs_ocr(text):
+                cached = page_cache.get_ocr(doc_hash, i, dpi) if page_cache is not None else None
+                if cached is not None:
+                    metrics.count("ocr_cache_hits")
+                    text = cached
+                else:
+                    if doc is None:
+                        doc = fitz.open(file_path)
+                    # Pagina bianca o solo disegni vettoriali: non c'è niente da leggere
+                    if doc[i].get_images(full=True):
+                        if pool is None:
+                            pool = ProcessPoolExecutor(max_workers=workers)
+                        ocr = pool.submit(ocr_page, file_path, i, dpi, language)
+            pending.append((i, num_pages, text, ocr))
+            while pending and (len(pending) > max_pending or pending[0][3] is None or pending[0][3].done()):
+                yield _resolve(pending.popleft(), dpi, page_cache, doc_hash)
+        while pending:
+            yield _resolve(pending.popleft(), dpi, page_cache, doc_hash)
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+        if doc is not None:
+            doc.close()
+
+
+def _resolve(item, dpi, page_cache, doc_hash):
+    i, num_pages, text, ocr = item
+    if ocr is None:
+        return i, num_pages, text
+    try:
+        ocr_text, seconds = ocr.result()
+    except Exception as e:
+        # Un errore di Tesseract su una pagina non deve far perdere il resto del PDF
+        metrics.count("ocr_errors")
+        metrics.event("ocr_error", page=i + 1, error=str(e))
+        return i, num_pages, text
+    metrics.observe("ocr_page_seconds", seconds, log=False, dpi=str(dpi))
+    if page_cache is not None:
+        page_cache.put_ocr(doc_hash, i, dpi, ocr_text)
+    return i, num_pages, ocr_text
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+
+PAGE_CACHE_PATH = "page_cache.sqlite"
+# Pagine scritte insieme in un'unica transazione
+WRITE_BATCH = 64
+
+
+class PageTextCache:
+    """Testo estratto da ogni pagina dei PDF, indirizzato per hash del file.
+
+    Permette di ridividere in chunk un documento (ad esempio con un altro
+    chunk_size) senza rileggere il PDF con fitz. Un documento è disponibile
+    solo dopo che tutte le sue pagine sono state salvate. Il testo letto con
+    l'OCR è salvato a parte, per pagina e dpi.
+    """
+
+    def __init__(self, path=PAGE_CACHE_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " doc_hash TEXT NOT NULL, page INTEGER NOT NULL, text TEXT NOT NULL, PRIMARY KEY (doc_hash, page))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS documents (doc_hash TEXT PRIMARY KEY, num_pages INTEGER NOT NULL)")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS ocr ("
+            " doc_hash TEXT NOT NULL, page INTEGER NOT NULL, dpi INTEGER NOT NULL, text TEXT NOT NULL,"
+            " PRIMARY KEY (doc_hash, page, dpi))"
+        )
+        self._conn.commit()
+
+    def __contains__(self, doc_hash):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone() is not None
+
+    def iter_pages(self, doc_hash):
+        """Pagine salvate come tuple (indice_pagina, numero_pagine, testo), come iter_pdf_pages."""
+        with self._lock:
+            row = self._conn.execute("SELECT num_pages FROM documents WHERE doc_hash = ?", (doc_hash,)).fetchone()
+        if row is None:
+            return
+        num_pages = row[0]
+        # Lettura a blocchi: il testo dell'intero documento non viene mai caricato insieme
+        for start in range(0, num_pages, WRITE_BATCH):
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT page, text FROM pages WHERE doc_hash = ? AND page >= ? AND page < ? ORDER BY page",
+                    (doc_hash, start, start + WRITE_BATCH),
+                ).fetchall()
+            for page, text in rows:
+                yield page, num_pages, text
+
+    def record(self, doc_hash, pages):
+        """Restituisce le tuple di pages salvandole; il documento è registrato quando pages finisce."""
+        batch = []
+        num_pages = 0
+        for item in pages:
+            i, num_pages, text = item
+            batch.append((doc_hash, i, text))
+            if len(batch) == WRITE_BATCH:
+                self._write(batch)
+                batch = []
+            yield item
+        self._write(batch, (doc_hash, num_pages))
+
+    def _write(self, rows, document=None):
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO pages (doc_hash, page, text) VALUES (?, ?, ?)", rows)
+            if document is not None:
+                self._conn.execute("INSERT OR REPLACE INTO documents (doc_hash, num_pages) VALUES (?, ?)", document)
+            self._conn.commit()
+
+    def get_ocr(self, doc_hash, page, dpi):
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM ocr WHERE doc_hash = ? AND page = ? AND dpi = ?",
+                                     (doc_hash, page, dpi)).fetchone()
+        return row[0] if row is not None else None
+
+    def put_ocr(self, doc_hash, page, dpi, text):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO ocr (doc_hash, page, dpi, text) VALUES (?, ?, ?, ?)",
+                               (doc_hash, page, dpi, text))
+            self._conn.commit()
+
+    def remove(self, doc_hash):
+        with self._lock:
+            self._conn.execute("DELETE FROM pages WHERE doc_hash = ?", (doc_hash,))
+            self._conn.execute("DELETE FROM ocr WHERE doc_hash = ?", (doc_hash,))
+            self._conn.execute("DELETE FROM documents WHERE doc_hash = ?", (doc_hash,))
+            self._conn.commit()
@@ -0,0 +1,47 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz  # PyMuPDF per leggere i PDF
+
+PDF_WORKERS = os.cpu_count() or 1
+# Sotto questa soglia avviare i processi costa più che leggere le pagine in sequenza
+PARALLEL_MIN_PAGES = 64
+
+
+def extract_page_range(file_path, start, stop):
+    # Eseguita nei processi worker: ognuno apre il proprio documento fitz
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+
+def iter_pdf_pages(file_path, workers=1):
+    """Estrae il testo del PDF una pagina alla volta.
+
+    Restituisce tuple (indice_pagina, numero_pagine, testo) senza mai tenere
+    in memoria il testo dell'intero documento. Con workers > 1 i PDF grandi
+    vengono letti da più processi, restituendo comunque le pagine in ordine.
+    """
+    with fitz.open(file_path) as doc:
+        num_pages = len(doc)
+        if workers <= 1 or num_pages < PARALLEL_MIN_PAGES:
+            for i, page in enumerate(doc):
+                yield i, num_pages, page.get_text()
+            return
+
+    yield from _iter_pages_parallel(file_path, num_pages, workers)
+
+
+def _iter_pages_parallel(file_path, num_pages, workers):
+    # Blocchi piccoli per restituire presto le prime pagine e bilanciare il carico
+    block = max(8, -(-num_pages // (workers * 4)))
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [pool.submit(extract_page_range, file_path, start, min(start + block, num_pages))
+                   for start in range(0, num_pages, block)]
+        i = 0
+        for future in futures:
+            for text in future.result():
+                yield i, num_pages, text
+                i += 1
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import namedtuple
+
+from chatbot_core.context import pack_context
+from chatbot_core.embedding_cache import embedding_model_name
+from chatbot_core.embeddings import embedding_workers
+from chatbot_core.indexing import (CHUNK_OVERLAP, CHUNK_SIZE, CHUNK_WORKERS, EMBEDDING_WORKERS, PageQueue,
+                                   build_index_streaming, iter_chunks, make_splitter, update_index)
+from chatbot_core.library import file_hash
+from chatbot_core.metrics import metrics
+from chatbot_core.ocr import ocr_available, with_ocr
+from chatbot_core.pdf import PDF_WORKERS, iter_pdf_pages
+from chatbot_core.retrieval import retrieve
+
+# cached: la risposta viene dalla cache; question: la domanda a cui era stata data
+Answer = namedtuple("Answer", ["text", "cached", "question"])
+# answer: risposta pronta senza chiamare il modello; altrimenti contesto e storia per generarla
+Prepared = namedtuple("Prepared", ["answer", "context", "query_embedding", "history", "cacheable"])
+
+
+def extract_pages(file_path, page_queue, on_progress=None, workers=PDF_WORKERS, page_cache=None, doc_hash=None):
+    """Legge il PDF passando le pagine a page_queue.
+
+    Con page_cache le pagine di un PDF già letto vengono prese dalla cache
+    senza aprirlo con fitz, e quelle di un PDF nuovo vi vengono salvate.
+    Le pagine scansionate passano dall'OCR, se Tesseract è installato.
+    Restituisce una stringa vuota se la lettura è riuscita, altrimenti il
+    messaggio di errore da mostrare all'utente.
+    """
+    try:
+        if page_cache is None:
+            pages = iter_pdf_pages(file_path, workers)
+        else:
+            doc_hash = doc_hash or file_hash(file_path)
+            if doc_hash in page_cache:
+                pages = page_cache.iter_pages(doc_hash)
+            else:
+                pages = page_cache.record(doc_hash, iter_pdf_pages(file_path, workers))
+        if ocr_available():
+            # Nella cache delle pagine resta il livello di testo del PDF: l'OCR ha una cache propria per dpi
+            pages = with_ocr(pages, file_path, page_cache=page_cache, doc_hash=doc_hash)
+        has_text = False
+        num_pages = 0
+        start = last = time.perf_counter()
+        for i, num_pages, text in pages:
+            metrics.observe("pdf_page_seconds", time.perf_counter() - last, log=False)
+            # Le pagine passano subito all'indicizzazione, che lavora in parallelo
+            page_queue.put(text)
+            # L'attesa sulla coda piena non è tempo di estrazione
+            last = time.perf_counter()
+            has_text = has_text or bool(text.strip())
+            if on_progress:
+                on_progress(int(((i + 1) / num_pages) * 100))
+        metrics.observe("pdf_extraction_seconds", time.perf_counter() - start, fields={"pages": num_pages})
+
+        if num_pages == 0:
+            return "Errore: Il PDF è vuoto o non può essere letto."
+        if not has_text:
+            if not ocr_available():
+                return ("Errore: Il PDF non contiene testo leggibile. Per i PDF scansionati installa Tesseract "
+                        "con la lingua italiana per leggerli con l'OCR.")
+            return "Errore: Il PDF non contiene testo leggibile."
+        return ""
+    except Exception as e:
+        page_queue.abort()
+        return f"Errore nel caricamento del PDF: {e}"
+    finally:
+        page_queue.close()
+
+
+def index_pages(page_queue, library, embeddings, doc_hash, title, base_hash=None,
+                chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Indicizza le pagine in arrivo da page_queue e salva l'indice nella libreria.
+
+    Con base_hash parte dall'indice della versione precedente del documento,
+    se era stato creato con gli stessi embedding, e calcola gli embedding solo
+    dei chunk cambiati; base_hash può anche essere doc_hash stesso, quando lo
+    stesso PDF viene ridiviso con altri parametri. L'indice di base resta
+    nella libreria: decidere se eliminarlo spetta a chi chiama.
+    Restituisce il vectorstore, oppure None se non c'è niente da indicizzare.
+    """
+    try:
+        start = time.perf_counter()
+        workers = embedding_workers(embeddings, EMBEDDING_WORKERS)
+        # Il titolo identifica il documento anche tra versioni diverse dello stesso PDF
+        chunks = (
+            (text, dict(metadata, source=title))
+            for text, metadata in iter_chunks(page_queue, make_splitter(chunk_size, chunk_overlap), CHUNK_WORKERS)
+        )
+        # L'aggiornamento incrementale richiede i vettori esatti: solo da indici flat con gli stessi embedding
+        if (base_hash and library.embeddings_name(base_hash) == embeddings.name
+                and library.stored_format(base_hash) == "flat"):
+            vectorstore, added, removed = update_index(library.load(base_hash), chunks, embeddings, doc_hash, workers)
+            metrics.event("incremental_update", title=title, added=added, removed=removed)
+        else:
+            vectorstore = build_index_streaming(chunks, embeddings, doc_hash, workers)
+        if vectorstore is None or page_queue.aborted or not vectorstore.index.ntotal:
+            return None
+
+        library.add(doc_hash, vectorstore, title, page_queue.pages_read,
+                    vectorstore.index.ntotal, embedding_model_name(embeddings.embeddings), embeddings.name,
+                    chunk_size, chunk_overlap)
+        metrics.observe("indexing_seconds", time.perf_counter() - start,
+                        fields={"title": title, "pages": page_queue.pages_read, "chunks": vectorstore.index.ntotal})
+        metrics.export()
+        return vectorstore
+    except Exception:
+        # Svuota la coda per non bloccare il thread che legge il PDF
+        for _ in page_queue:
+            pass
+        raise
+
+
+def index_pdf(file_path, library, embeddings, title=None, page_cache=None,
+              chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Carica un PDF nella libreria senza interfaccia grafica.
+
+    Restituisce l'hash del documento; se era già indicizzato con gli stessi
+    parametri di chunking non viene riletto. Un documento con lo stesso
+    titolo serve solo da base per l'aggiornamento incrementale e resta nella libreria.
+    """
+    doc_hash = file_hash(file_path)
+    if library.chunked_with(doc_hash, chunk_size, chunk_overlap):
+        return doc_hash
+
+    title = title or file_path.replace("\\", "/").rsplit("/", 1)[-1]
+    page_queue = PageQueue()
+    result = {}
+    loader = threading.Thread(target=lambda: result.update(
+        error=extract_pages(file_path, page_queue, page_cache=page_cache, doc_hash=doc_hash)))
+    loader.start()
+    vectorstore = index_pages(page_queue, library, embeddings, doc_hash, title, library.find_by_title(title),
+                              chunk_size, chunk_overlap)
+    loader.join()
+    if result.get("error"):
+        raise RuntimeError(result["error"])
+    if vectorstore is None:
+        raise RuntimeError("Errore nella creazione dell'indice.")
+    return doc_hash
+
+
+def prepare_answer(question, retriever, backend, answer_cache=None, doc_key="", conversation=None, prefetcher=None):
+    """Tutto ciò che precede la generazione: cache delle risposte e recupero del contesto.
+
+    Restituisce Prepared con answer già pronta (cache o nessun documento
+    pertinente) oppure con il contesto da passare al modello. Con conversation
+    la storia entra nel prompt e il contesto recuperato si riduce di altrettanti token;
+    le domande di seguito non usano la cache e sono cercate insieme alla precedente.
+    Con prefetcher si riusano i documenti già cercati mentre la domanda veniva scritta.
+    """
+    history = conversation.history_text() if conversation is not None else ""
+    follow_up = conversation is not None and conversation.is_follow_up(question)
+    if follow_up:
+        # La risposta a una domanda di seguito dipende dalla storia: la cache non vale
+        metrics.count("follow_up_questions")
+        answer_cache = None
+    query_embedding = []
+
+    def embed_query(text):
+        # Embedding della domanda per la cache semantica, conservato per salvarlo con la risposta
+        query_embedding.append(retriever.vectorstore.embeddings.embed_query(text))
+        return query_embedding[-1]
+
+    if answer_cache is not None:
+        with metrics.span("answer_cache_lookup"):
+            hit = answer_cache.get(doc_key, backend.model_name, question,
+                                   embed_query if answer_cache.semantic else None)
+        if hit:
+            metrics.count("answer_cache_hits")
+            return Prepared(Answer(hit[0], True, hit[1]), None, None, "", False)
+        metrics.count("answer_cache_misses")
+
+    search_query = conversation.retrieval_query(question) if conversation is not None else question
+    relevant_docs = prefetcher.lookup(retriever, doc_key, search_query) if prefetcher is not None else None
+    if relevant_docs is not None:
+        metrics.count("prefetch_hits")
+    else:
+        if prefetcher is not None:
+            metrics.count("prefetch_misses")
+        with metrics.span("retrieval"):
+            relevant_docs = retrieve(retriever, search_query)
+    if not relevant_docs and backend.no_context_answer:
+        return Prepared(Answer(backend.no_context_answer, False, question), None, None, "", False)
+
+    history_tokens = backend.count_tokens(history) if history else 0
+    if history:
+        metrics.observe("history_tokens", history_tokens, backend=backend.name)
+    with metrics.span("context_packing"):
+        context = pack_context(relevant_docs, backend.context_token_budget - history_tokens, backend.count_tokens)
+    metrics.observe("context_tokens", backend.count_tokens(context), fields={"chunks": len(relevant_docs)})
+    return Prepared(None, context, query_embedding[-1] if query_embedding else None, history, not follow_up)
+
+
+def record_first_token(backend, seconds, on_first_token=None):
+    metrics.observe("time_to_first_token_seconds", seconds, backend=backend.name)
+    if on_first_token:
+        on_first_token(seconds)
+
+
+def record_generation(backend, seconds, parts):
+    metrics.observe("generation_seconds", seconds, backend=backend.name)
+    metrics.observe("answer_tokens", len(parts), backend=backend.name)
+
+
+def finish_answer(question, parts, backend, prepared, answer_cache=None, doc_key="", model=None):
+    """Compone la risposta generata e la salva nella cache.
+
+    model è il modello che ha generato la risposta, se diverso da quello di
+    backend (un backend di riserva): la risposta non viene salvata, perché
+    la cache viene interrogata con il modello di backend.
+    """
+    if not parts:
+        return Answer(backend.empty_answer, False, question)
+
+    answer = "".join(parts)
+    # Le risposte alle domande di seguito dipendono dalla storia della conversazione: non si riusano
+    if answer_cache is not None and prepared.cacheable and model in (None, backend.model_name):
+        answer_cache.put(doc_key, backend.model_name, question, answer, prepared.query_embedding)
+    return Answer(answer, False, question)
@@ -0,0 +1,86 @@
+import difflib
+import threading
+from collections import OrderedDict
+
+from chatbot_core.answer_cache import normalize_question
+from chatbot_core.metrics import metrics
+from chatbot_core.retrieval import page_scope, retrieve
+
+PREFETCH_CACHE_SIZE = 32
+# Testi più corti sono ancora troppo incompleti perché valga la pena cercare
+PREFETCH_MIN_WORDS = 3
+# Somiglianza minima tra il testo anticipato e la domanda inviata per riusarne i documenti
+PREFETCH_MIN_SIMILARITY = 0.9
+
+
+class RetrievalPrefetcher:
+    """Recupero dei documenti anticipato mentre l'utente scrive la domanda.
+
+    prefetch avvia la ricerca del testo corrente con executor; una ricerca
+    non ancora partita viene annullata da quella successiva. lookup
+    restituisce i documenti trovati per un testo uguale o quasi uguale alla
+    domanda inviata, con le stesse pagine citate, altrimenti None.
+    """
+
+    def __init__(self, executor, size=PREFETCH_CACHE_SIZE, min_similarity=PREFETCH_MIN_SIMILARITY):
+        self.executor = executor
+        self.size = size
+        self.min_similarity = min_similarity
+        # (doc_key, testo normalizzato) -> (retriever, documenti), dal meno recente
+        self._results = OrderedDict()
+        self._pending = None
+        self._pending_key = None
+        self._lock = threading.Lock()
+
+    def prefetch(self, retriever, doc_key, query):
+        key = (doc_key, normalize_question(query))
+        if len(key[1].split()) < PREFETCH_MIN_WORDS:
+            return
+        with self._lock:
+            if key in self._results or (key == self._pending_key and not self._pending.done()):
+                return
+            if self._pending is not None:
+                self._pending.cancel()
+            self._pending_key = key
+            self._pending = self.executor.submit(self._run, retriever, key, query)
+
+    def _run(self, retriever, key, query):
+        with metrics.span("retrieval_prefetch"):
+            docs = retrieve(retriever, query)
+        with self._lock:
+            self._results[key] = (retriever, docs)
+            self._results.move_to_end(key)
+            while len(self._results) > self.size:
+                self._results.popitem(last=False)
+        return docs
+
+    def lookup(self, retriever, doc_key, query):
+        key = (doc_key, normalize_question(query))
+        with self._lock:
+            pending = self._pending if key == self._pending_key else None
+            entry = self._results.get(key)
+            if entry is None:
+                entry = self._closest(key)
+        if entry is None and pending is not None:
+            # Ricerca dello stesso testo ancora in corso: si attende invece di ripeterla
+            try:
+                pending.result()
+            except Exception:
+                return None
+            with self._lock:
+                entry = self._results.get(key)
+        if entry is None or entry[0] is not retriever:
+            return None
+        return entry[1]
+
+    def _closest(self, key):
+        doc_key, text = key
+        pages = page_scope(text)
+        best, best_ratio = None, self.min_similarity
+        for (other_doc_key, other_text), entry in self._results.items():
+            if other_doc_key != doc_key or page_scope(other_text) != pages:
+                continue
+            ratio = difflib.SequenceMatcher(None, text, other_text).ratio()
+            if ratio >= best_ratio:
+                best, best_ratio = entry, ratio
+        return best
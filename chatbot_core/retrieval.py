@@ -0,0 +1,219 @@
+import functools
+import json
+import math
+import os
+import re
+from collections import Counter
+
+from chatbot_core.indexing import estimate_tokens
+
+BM25_FILE = "bm25.json"
+# Peso della similarità vettoriale rispetto a BM25 nella fusione dei punteggi
+VECTOR_WEIGHT = 0.5
+# Si tengono i documenti con punteggio almeno pari a questa frazione del migliore
+SCORE_CUTOFF = 0.5
+MIN_K = 3
+RERANKER_MODEL = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+# FAISS filtra dopo la ricerca: con un filtro di pagina si chiedono più vicini per trovarne abbastanza
+PAGE_FILTER_FETCH = 20
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PAGE_SCOPE_RE = re.compile(r"\bpag(?:ina|ine|\.)\s*(\d+)(?:\s*(?:-|–|a)\s*(\d+))?", re.IGNORECASE)
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _doc_key(doc):
+    return getattr(doc, "id", None) or doc.page_content
+
+
+def page_scope(question):
+    """Pagine citate nella domanda ("a pagina 12", "pagine 10-15") come (prima, ultima), altrimenti None."""
+    match = _PAGE_SCOPE_RE.search(question)
+    if not match:
+        return None
+    first = int(match.group(1))
+    last = int(match.group(2) or first)
+    return min(first, last), max(first, last)
+
+
+def _in_pages(metadata, pages):
+    page = metadata.get("page")
+    return page is not None and page <= pages[1] and metadata.get("page_end", page) >= pages[0]
+
+
+class BM25Index:
+    """Indice invertito BM25 sui chunk di uno o più documenti.
+
+    Viene calcolato una volta alla creazione dell'indice FAISS e salvato
+    accanto ad esso; gli indici di più documenti si uniscono senza ricalcolo.
+    """
+
+    def __init__(self, postings=None, doc_lengths=None, k1=1.5, b=0.75):
+        self.postings = postings or {}
+        self.doc_lengths = doc_lengths or {}
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def from_vectorstore(cls, vectorstore):
+        index = cls()
+        for doc_id in vectorstore.index_to_docstore_id.values():
+            index.add(doc_id, vectorstore.docstore.search(doc_id).page_content)
+        return index
+
+    def add(self, doc_id, text):
+        terms = Counter(tokenize(text))
+        self.doc_lengths[doc_id] = sum(terms.values())
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+    def merge(self, other):
+        for term, docs in other.postings.items():
+            self.postings.setdefault(term, {}).update(docs)
+        self.doc_lengths.update(other.doc_lengths)
+        return self
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"postings": self.postings, "doc_lengths": self.doc_lengths}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["postings"], data["doc_lengths"])
+
+    def search(self, query, k):
+        """Restituisce fino a k coppie (doc_id, punteggio), dal punteggio più alto."""
+        n = len(self.doc_lengths)
+        if not n:
+            return []
+        avg_len = sum(self.doc_lengths.values()) / n
+        scores = Counter()
+        for term in set(tokenize(query)):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_len)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores.most_common(k)
+
+
+@functools.lru_cache(maxsize=None)
+def load_reranker(model_name=RERANKER_MODEL):
+    try:
+        from sentence_transformers import CrossEncoder
+    except ImportError:
+        raise ImportError("Per il reranking installa sentence-transformers: pip install sentence-transformers") from None
+    return CrossEncoder(model_name, device="cpu")
+
+
+def _normalize(scores):
+    if not scores:
+        return {}
+    low, high = min(scores.values()), max(scores.values())
+    if high == low:
+        return {key: 1.0 for key in scores}
+    return {key: (value - low) / (high - low) for key, value in scores.items()}
+
+
+class HybridRetriever:
+    """Recupero ibrido: similarità FAISS fusa con BM25, reranking opzionale e k adattivo.
+
+    Dei candidati vengono tenuti solo quelli con punteggio vicino al migliore
+    (almeno MIN_K, al massimo k) finché il contesto resta entro token_budget.
+    """
+
+    def __init__(self, vectorstore, k, bm25=None, token_budget=None, reranker=None,
+                 vector_weight=VECTOR_WEIGHT, cutoff=SCORE_CUTOFF, min_k=MIN_K):
+        self.vectorstore = vectorstore
+        self.k = k
+        self.bm25 = bm25
+        self.token_budget = token_budget
+        self.reranker = reranker
+        self.vector_weight = vector_weight if bm25 else 1.0
+        self.cutoff = cutoff
+        self.min_k = min_k
+
+    def candidates(self, question, pages=None):
+        """Candidati ordinati per punteggio fuso, come lista di (documento, punteggio).
+
+        Con pages = (prima, ultima) si considerano solo i chunk di quelle pagine.
+        """
+        fetch_k = max(self.k * 3, 20)
+        search_kwargs = {}
+        if pages:
+            search_kwargs = {"filter": lambda metadata: _in_pages(metadata, pages),
+                             "fetch_k": fetch_k * PAGE_FILTER_FETCH}
+        docs = {}
+        # FAISS restituisce distanze: più sono piccole, più il documento è simile
+        vector_scores = {}
+        for doc, distance in self.vectorstore.similarity_search_with_score(question, k=fetch_k, **search_kwargs):
+            docs[_doc_key(doc)] = doc
+            vector_scores[_doc_key(doc)] = -float(distance)
+        keyword_scores = {}
+        if self.bm25:
+            keyword_scores = dict(self.bm25.search(question, fetch_k * PAGE_FILTER_FETCH if pages else fetch_k))
+        for doc_id in list(keyword_scores):
+            if doc_id not in docs:
+                doc = self.vectorstore.docstore.search(doc_id)
+                if hasattr(doc, "page_content") and (not pages or _in_pages(doc.metadata, pages)):
+                    docs[doc_id] = doc
+                else:
+                    del keyword_scores[doc_id]
+
+        vector_scores = _normalize(vector_scores)
+        keyword_scores = _normalize(keyword_scores)
+        fused = {
+            doc_id: self.vector_weight * vector_scores.get(doc_id, 0.0)
+            + (1 - self.vector_weight) * keyword_scores.get(doc_id, 0.0)
+            for doc_id in docs
+        }
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+        if self.reranker is not None and ranked:
+            top = [doc_id for doc_id, _ in ranked[:self.k * 2]]
+            scores = self.reranker.predict([(question, docs[doc_id].page_content) for doc_id in top])
+            reranked = _normalize(dict(zip(top, (float(score) for score in scores))))
+            ranked = sorted(reranked.items(), key=lambda item: item[1], reverse=True)
+
+        return [(docs[doc_id], score) for doc_id, score in ranked]
+
+    def invoke(self, question, pages=None):
+        selected = []
+        tokens = 0
+        ranked = self.candidates(question, pages)
+        best = ranked[0][1] if ranked else 0.0
+        for doc, score in ranked:
+            if len(selected) >= self.k:
+                break
+            if len(selected) >= self.min_k and score < best * self.cutoff:
+                break
+            doc_tokens = estimate_tokens(doc.page_content)
+            if selected and self.token_budget and tokens + doc_tokens > self.token_budget:
+                break
+            selected.append(doc)
+            tokens += doc_tokens
+        return selected
+
+
+def make_retriever(vectorstore, backend, bm25=None, reranker=None):
+    if reranker is None and os.getenv("CHATBOT_RERANKER"):
+        reranker = load_reranker()
+    return HybridRetriever(vectorstore, backend.retriever_k, bm25, backend.context_token_budget, reranker)
+
+
+def retrieve(retriever, question):
+    """Chunk pertinenti alla domanda, limitati alle pagine che cita se ce ne sono."""
+    pages = page_scope(question)
+    if pages:
+        docs = retriever.invoke(question, pages=pages)
+        # Pagine inesistenti o indici senza numeri di pagina: si cerca in tutto il documento
+        if docs:
+            return docs
+    return retriever.invoke(question)
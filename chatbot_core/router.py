@@ -0,0 +1,186 @@
+import asyncio
+import os
+import time
+
+from chatbot_core.generation import make_backend
+from chatbot_core.metrics import metrics
+
+# Backend di riserva, ad esempio "llama" oppure "openai:gpt-4o-mini,llama:meta-llama/Llama-3.1-8B-Instruct"
+FALLBACK_BACKENDS = os.getenv("CHATBOT_FALLBACK", "")
+HEDGE_ENABLED = os.getenv("CHATBOT_HEDGE", "1") != "0"
+HEDGE_QUANTILE = 0.95
+# Finché un backend ha meno misure di così la richiesta di riserva parte dopo HEDGE_DEFAULT_DELAY
+HEDGE_MIN_SAMPLES = 20
+HEDGE_DEFAULT_DELAY = 2.0
+HEDGE_MIN_DELAY = 0.3
+HEDGE_MAX_DELAY = 10.0
+
+
+def backend_label(backend):
+    return f"{backend.name}:{backend.model_name}"
+
+
+def parse_backends(spec):
+    """Backend da una lista separata da virgole di nomi, con il modello facoltativo dopo i due punti."""
+    backends = []
+    for item in spec.split(","):
+        item = item.strip()
+        if item:
+            name, _, model = item.partition(":")
+            backends.append(make_backend(name, **({"model": model} if model else {})))
+    return backends
+
+
+def make_router(primary, spec=FALLBACK_BACKENDS, hedge=HEDGE_ENABLED):
+    """primary stesso se spec è vuota, altrimenti un GenerationRouter con i backend di riserva."""
+    fallbacks = parse_backends(spec or "")
+    return GenerationRouter([primary] + fallbacks, hedge) if fallbacks else primary
+
+
+class _Attempt:
+    """Una richiesta a un backend, letta da un task che mette i token in coda."""
+
+    def __init__(self, backend, question, context, history):
+        self.backend = backend
+        self.tokens = asyncio.Queue()
+        # True al primo token, False se la richiesta finisce prima
+        self.first = asyncio.get_running_loop().create_future()
+        self.error = None
+        self.start = time.perf_counter()
+        self.task = asyncio.ensure_future(self._run(question, context, history))
+
+    def _observe_first_token(self):
+        metrics.observe("backend_first_token_seconds", time.perf_counter() - self.start, log=False,
+                        backend=backend_label(self.backend))
+
+    async def _run(self, question, context, history):
+        stream = self.backend.astream(question, context, history)
+        try:
+            async for token in stream:
+                if not self.first.done():
+                    self._observe_first_token()
+                    self.first.set_result(True)
+                self.tokens.put_nowait(token)
+        except Exception as e:
+            self.error = e
+            metrics.count("backend_errors", backend=backend_label(self.backend))
+            metrics.event("backend_error", backend=backend_label(self.backend), error=str(e))
+        finally:
+            await stream.aclose()
+            if not self.first.done():
+                self.first.set_result(False)
+            self.tokens.put_nowait(None)
+
+    @property
+    def failed(self):
+        return self.first.done() and not self.first.result()
+
+    def cancel(self):
+        if not self.first.done():
+            # Le richieste annullate contano con il tempo trascorso: senza, la p95 scenderebbe a ogni hedge
+            self._observe_first_token()
+        self.task.cancel()
+
+
+class _RoutedStream:
+    """Token di una risposta del router; backend è quello che la sta generando, noto dal primo token."""
+
+    def __init__(self, router, question, context, history):
+        self.backend = None
+        self._tokens = router._route(self, question, context, history)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self._tokens.__anext__()
+
+    async def aclose(self):
+        await self._tokens.aclose()
+
+
+class GenerationRouter:
+    """Genera con il primo backend e ripiega sugli altri.
+
+    Se il primo token non arriva entro la p95 dei tempi al primo token del
+    backend, parte anche la richiesta al successivo (hedge): si usa chi
+    risponde per primo e l'altra richiesta viene annullata. Un errore prima
+    del primo token passa subito al backend successivo; dopo, la risposta è
+    già in parte mostrata e l'errore viene propagato. Nomi, messaggi e
+    conteggio dei token sono quelli del backend principale, i budget il
+    minimo tra tutti, così il contesto entra in ognuno. Lo stream restituito
+    da astream indica in backend chi ha risposto, perché la risposta di un
+    backend di riserva non finisca in cache con il modello principale.
+    """
+
+    def __init__(self, backends, hedge=HEDGE_ENABLED):
+        self.backends = list(backends)
+        self.primary = self.backends[0]
+        self.hedge = hedge
+        self.context_token_budget = min(backend.context_token_budget for backend in self.backends)
+        self.history_token_budget = min(backend.history_token_budget for backend in self.backends)
+
+    def __getattr__(self, name):
+        return getattr(self.primary, name)
+
+    def hedge_delay(self, backend):
+        """Attesa del primo token prima di interrogare anche il backend successivo."""
+        p95 = metrics.quantile("backend_first_token_seconds", HEDGE_QUANTILE, HEDGE_MIN_SAMPLES,
+                               backend=backend_label(backend))
+        if p95 is None:
+            return HEDGE_DEFAULT_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, p95))
+
+    def astream(self, question, context, history=""):
+        return _RoutedStream(self, question, context, history)
+
+    async def _route(self, stream, question, context, history):
+        attempts = []
+
+        def launch():
+            if len(attempts) == len(self.backends):
+                return False
+            attempts.append(_Attempt(self.backends[len(attempts)], question, context, history))
+            return True
+
+        launch()
+        try:
+            winner = None
+            while winner is None:
+                winner = next((attempt for attempt in attempts if attempt.first.done() and not attempt.failed), None)
+                if winner is not None:
+                    break
+                newest = attempts[-1]
+                if newest.failed and len(attempts) < len(self.backends):
+                    # Si passa subito al successivo anche se una richiesta precedente è ancora in attesa
+                    metrics.count("generation_failovers", backend=backend_label(newest.backend))
+                    launch()
+                    continue
+                live = [attempt for attempt in attempts if not attempt.first.done()]
+                if not live:
+                    raise newest.error or RuntimeError("Nessun backend ha risposto.")
+                timeout = None
+                if self.hedge and len(attempts) < len(self.backends):
+                    timeout = max(0.0, self.hedge_delay(newest.backend) - (time.perf_counter() - newest.start))
+                done, _ = await asyncio.wait([attempt.first for attempt in live], timeout=timeout,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    metrics.count("generation_hedged", backend=backend_label(attempts[-1].backend))
+                    launch()
+
+            metrics.count("generation_answers", backend=backend_label(winner.backend))
+            stream.backend = winner.backend
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.cancel()
+            while True:
+                token = await winner.tokens.get()
+                if token is None:
+                    break
+                yield token
+            if winner.error is not None:
+                raise winner.error
+        finally:
+            for attempt in attempts:
+                if not attempt.task.done():
+                    attempt.cancel()
@@ -0,0 +1,413 @@
+"""Server HTTP locale: più utenti condividono indici, cache e client del modello in un solo processo.
+
+Esempio:
+    python -m chatbot_core.server --backend openai --host 0.0.0.0 --port 8000 --concurrency 8
+
+Endpoint (JSON, tranne /stream che risponde con Server-Sent Events):
+    GET  /documents            documenti indicizzati
+    POST /documents            indicizza un PDF: corpo application/pdf con header X-Filename
+    GET  /documents/<hash>     stato dell'indicizzazione e dati del documento
+    POST /query                {"question", "documents", "user", "new_conversation"} -> risposta completa
+    POST /stream               come /query, con i token inviati man mano che arrivano
+    GET  /metrics              metriche nel formato testuale di Prometheus
+"""
+import argparse
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+from chatbot_core.answer_cache import AnswerCache
+from chatbot_core.embeddings import EMBEDDING_BACKENDS, make_embeddings
+from chatbot_core.engine import MAX_IN_FLIGHT, QueryEngine
+from chatbot_core.generation import BACKENDS, make_backend
+from chatbot_core.library import DocumentLibrary, file_hash
+from chatbot_core.metrics import metrics
+from chatbot_core.page_cache import PageTextCache
+from chatbot_core.pipeline import index_pdf
+from chatbot_core.retrieval import make_retriever
+from chatbot_core.router import FALLBACK_BACKENDS, make_router
+
+DEFAULT_PORT = 8000
+# Combinazioni di documenti tenute in memoria con il loro retriever
+RETRIEVER_CACHE_SIZE = 16
+UPLOAD_MAX_BYTES = 200 * 1024 * 1024
+# Intervallo dei commenti SSE inviati mentre la domanda attende il turno o il primo token,
+# più breve del timeout di lettura dei client
+STREAM_KEEPALIVE_SECONDS = 10
+
+
+class FairQueue:
+    """Assegna gli slot del modello agli utenti a turno (round robin).
+
+    Ogni utente ha al più una domanda in esecuzione e una in attesa: come
+    nella GUI, una nuova domanda sostituisce quella precedente ancora in coda.
+    Chi invia molte domande non fa quindi attendere gli altri.
+    """
+
+    def __init__(self, slots):
+        self.slots = slots
+        self.running = 0
+        self._running_users = set()
+        self._waiting = {}
+        self._order = deque()
+        self._lock = threading.Lock()
+
+    def _dispatch(self):
+        while self.running < self.slots:
+            user = next((user for user in self._order if user not in self._running_users), None)
+            if user is None:
+                return
+            self._order.remove(user)
+            self.running += 1
+            self._running_users.add(user)
+            self._waiting.pop(user).set()
+
+    def acquire(self, user):
+        """Attende il turno dell'utente; False se nel frattempo è arrivata una sua domanda più recente."""
+        ticket = threading.Event()
+        ticket.superseded = False
+        with self._lock:
+            previous = self._waiting.get(user)
+            if previous is not None:
+                previous.superseded = True
+                previous.set()
+            else:
+                self._order.append(user)
+            self._waiting[user] = ticket
+            self._dispatch()
+        ticket.wait()
+        return not ticket.superseded
+
+    def release(self, user):
+        with self._lock:
+            self.running -= 1
+            self._running_users.discard(user)
+            self._dispatch()
+
+    def waiting(self):
+        with self._lock:
+            return len(self._waiting)
+
+
+class ChatbotService:
+    """Stato condiviso dal server: libreria, retriever caricati, cache, engine e indicizzazioni in corso."""
+
+    def __init__(self, backend, concurrency=MAX_IN_FLIGHT, embeddings=None):
+        self.backend = backend
+        self.library = DocumentLibrary(backend.library_dir)
+        self.library.import_legacy(*backend.legacy_index)
+        # Gli embedding si creano alla prima indicizzazione: un pacchetto opzionale mancante
+        # fa fallire solo quella, non l'avvio del server
+        self.embeddings_name = embeddings or backend.embeddings
+        self.page_cache = PageTextCache()
+        self.answer_cache = AnswerCache()
+        self.engine = QueryEngine(backend, max_in_flight=concurrency)
+        self.fair_queue = FairQueue(concurrency)
+        self.upload_dir = os.path.join(backend.library_dir, "uploads")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        self._retrievers = OrderedDict()
+        self._documents_by_user = {}
+        self._futures = {}
+        self._indexing = {}
+        self._lock = threading.Lock()
+        # Un'indicizzazione alla volta: il manifest della libreria è condiviso
+        self._index_lock = threading.Lock()
+
+    def retriever(self, doc_hashes):
+        """Retriever dei documenti indicati, caricato una sola volta e condiviso da tutti gli utenti."""
+        key = tuple(sorted(doc_hashes))
+        with self._lock:
+            entry = self._retrievers.get(key)
+            if entry is None:
+                # Un lock per combinazione: più utenti che chiedono gli stessi documenti attendono un solo caricamento
+                entry = self._retrievers[key] = {"lock": threading.Lock(), "retriever": None}
+            self._retrievers.move_to_end(key)
+            while len(self._retrievers) > RETRIEVER_CACHE_SIZE:
+                self._retrievers.popitem(last=False)
+        with entry["lock"]:
+            if entry["retriever"] is None:
+                try:
+                    vectorstore = self.library.load_merged(list(key))
+                    bm25 = self.library.load_bm25(list(key))
+                    entry["retriever"] = make_retriever(vectorstore, self.backend, bm25)
+                except Exception:
+                    # La prossima domanda riprova il caricamento invece di trovare la voce vuota
+                    with self._lock:
+                        if self._retrievers.get(key) is entry:
+                            del self._retrievers[key]
+                    raise
+            return entry["retriever"]
+
+    def _forget_retrievers(self, doc_hash):
+        with self._lock:
+            for key in [key for key in self._retrievers if doc_hash in key]:
+                del self._retrievers[key]
+
+    def status(self, doc_hash):
+        with self._lock:
+            state = dict(self._indexing.get(doc_hash, {}))
+        entry = self.library.get(doc_hash)
+        if entry is not None and state.get("status") != "indexing":
+            state = dict(entry, status="ready", hash=doc_hash)
+        return state or None
+
+    def index(self, file_path, title):
+        """Avvia l'indicizzazione in background; lo stesso PDF inviato da più utenti viene indicizzato una volta."""
+        doc_hash = file_hash(file_path)
+        with self._lock:
+            state = self._indexing.get(doc_hash)
+            if state and state["status"] == "indexing":
+                return doc_hash
+            if self.library.chunked_with(doc_hash):
+                return doc_hash
+            self._indexing[doc_hash] = {"status": "indexing", "hash": doc_hash, "title": title}
+        threading.Thread(target=self._index, args=(file_path, doc_hash, title), daemon=True).start()
+        return doc_hash
+
+    def _index(self, file_path, doc_hash, title):
+        try:
+            with self._index_lock:
+                index_pdf(file_path, self.library, make_embeddings(self.embeddings_name), title, self.page_cache)
+            self._forget_retrievers(doc_hash)
+            state = {"status": "ready", "hash": doc_hash, "title": title}
+        except Exception as e:
+            metrics.event("indexing_error", title=title, error=str(e))
+            state = {"status": "error", "hash": doc_hash, "title": title, "error": str(e)}
+        with self._lock:
+            self._indexing[doc_hash] = state
+
+    def submit(self, user, question, doc_hashes, new_conversation=False, **callbacks):
+        """Accoda la domanda rispettando il turno dell'utente e restituisce il Future dell'engine.
+
+        Restituisce None se prima del suo turno l'utente ha inviato un'altra domanda.
+        """
+        retriever = self.retriever(doc_hashes)
+        doc_key = ",".join(sorted(doc_hashes))
+        with self._lock:
+            # Cambiando documenti l'utente inizia una nuova conversazione
+            changed = self._documents_by_user.get(user) != doc_key
+            self._documents_by_user[user] = doc_key
+            previous = self._futures.get(user)
+        if previous is not None:
+            # La domanda precedente dell'utente non serve più e libera il suo slot
+            previous.cancel()
+        if new_conversation or changed:
+            self.engine.reset_session(user)
+        if not self.fair_queue.acquire(user):
+            return None
+        try:
+            future = self.engine.submit(question, retriever, self.answer_cache, doc_key, session=user, **callbacks)
+        except Exception:
+            self.fair_queue.release(user)
+            raise
+        with self._lock:
+            self._futures[user] = future
+        future.add_done_callback(lambda _: self.fair_queue.release(user))
+        return future
+
+
+class ChatbotHandler(BaseHTTPRequestHandler):
+    # HTTP/1.0: la fine di una risposta in streaming coincide con la chiusura della connessione
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        metrics.event("http_request", client=self.client_address[0], request=format % args)
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json({"error": message}, status)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        if length > UPLOAD_MAX_BYTES:
+            raise ValueError("File troppo grande.")
+        return self.rfile.read(length)
+
+    def do_GET(self):
+        try:
+            self._get()
+        except Exception as e:
+            metrics.event("server_error", path=self.path, error=str(e))
+            self._send_error(500, str(e))
+
+    def _get(self):
+        if self.path == "/documents":
+            self._send_json({"documents": self.service.library.documents()})
+        elif self.path.startswith("/documents/"):
+            state = self.service.status(self.path.rsplit("/", 1)[-1])
+            if state is None:
+                self._send_error(404, "Documento sconosciuto.")
+            else:
+                self._send_json(state)
+        elif self.path == "/metrics":
+            data = metrics.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        elif self.path == "/health":
+            self._send_json({"status": "ok", "backend": self.service.backend.name,
+                             "waiting": self.service.fair_queue.waiting()})
+        else:
+            self._send_error(404, "Percorso sconosciuto.")
+
+    def do_POST(self):
+        try:
+            if self.path == "/documents":
+                self._upload()
+            elif self.path in ("/query", "/stream"):
+                self._query(stream=self.path == "/stream")
+            else:
+                self._send_error(404, "Percorso sconosciuto.")
+        except (ValueError, KeyError) as e:
+            self._send_error(400, str(e))
+        except Exception as e:
+            # Ad esempio un indice che non si carica: il client riceve comunque una risposta
+            metrics.event("server_error", path=self.path, error=str(e))
+            self._send_error(500, str(e))
+
+    def _upload(self):
+        # Solo file inviati nel corpo della richiesta: il server non indicizza percorsi scelti dal client
+        body = self._read_body()
+        title = os.path.basename(unquote(self.headers.get("X-Filename", "documento.pdf")))
+        path = os.path.join(self.service.upload_dir, hashlib.sha256(body).hexdigest() + ".pdf")
+        if not os.path.exists(path):
+            with tempfile.NamedTemporaryFile(dir=self.service.upload_dir, delete=False) as f:
+                f.write(body)
+            os.replace(f.name, path)
+        doc_hash = self.service.index(path, title)
+        self._send_json(self.service.status(doc_hash), 202)
+
+    def _query(self, stream):
+        request = json.loads(self._read_body() or b"{}")
+        question = request["question"].strip()
+        doc_hashes = request.get("documents") or []
+        user = request.get("user") or self.headers.get("X-User") or self.client_address[0]
+        if not question:
+            raise ValueError("Domanda vuota.")
+        # Documenti sconosciuti, ancora in indicizzazione o falliti non hanno un indice da caricare
+        not_ready = [doc_hash for doc_hash in doc_hashes
+                     if (self.service.status(doc_hash) or {}).get("status") != "ready"]
+        if not doc_hashes or not_ready:
+            raise ValueError("Documenti non indicizzati: " + ", ".join(not_ready or ["nessuno selezionato"]))
+
+        events = queue.Queue()
+        callbacks = {
+            "on_done": lambda answer: events.put(("done", answer)),
+            "on_error": lambda e: events.put(("error", e)),
+        }
+        new_conversation = bool(request.get("new_conversation"))
+        if not stream:
+            future = self.service.submit(user, question, doc_hashes, new_conversation, **callbacks)
+            if future is None:
+                self._send_error(409, "Domanda sostituita da una più recente.")
+                return
+            future.add_done_callback(lambda f: f.cancelled() and events.put(("error", "Domanda annullata.")))
+            kind, value = events.get()
+            if kind == "done":
+                self._send_json({"answer": value.text, "cached": value.cached, "question": value.question})
+            else:
+                self._send_error(500, str(value))
+            return
+
+        callbacks["on_token"] = lambda token: events.put(("token", token))
+        callbacks["on_first_token"] = lambda seconds: events.put(("first_token", seconds))
+        # Gli header partono subito: l'attesa del turno in FairQueue avviene in un altro thread,
+        # mentre qui si inviano commenti SSE che tengono viva la connessione
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        submitted = []
+        disconnected = threading.Event()
+
+        def submit():
+            try:
+                future = self.service.submit(user, question, doc_hashes, new_conversation, **callbacks)
+            except Exception as e:
+                metrics.event("server_error", path=self.path, error=str(e))
+                events.put(("error", e))
+                return
+            if future is None:
+                events.put(("error", "Domanda sostituita da una più recente."))
+                return
+            future.add_done_callback(lambda f: f.cancelled() and events.put(("error", "Domanda annullata.")))
+            submitted.append(future)
+            if disconnected.is_set():
+                future.cancel()
+
+        threading.Thread(target=submit, daemon=True).start()
+        try:
+            while True:
+                try:
+                    kind, value = events.get(timeout=STREAM_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    self.wfile.write(b": attesa\n\n")
+                    self.wfile.flush()
+                    continue
+                if kind == "token":
+                    payload = {"token": value}
+                elif kind == "first_token":
+                    payload = {"first_token": value}
+                elif kind == "done":
+                    payload = {"done": True, "answer": value.text, "cached": value.cached, "question": value.question}
+                else:
+                    payload = {"error": str(value)}
+                self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                if kind in ("done", "error"):
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            # Il client ha chiuso la connessione: la domanda non serve più, anche se è ancora in coda
+            disconnected.set()
+            for future in submitted:
+                future.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="openai")
+    parser.add_argument("--fallback", default=FALLBACK_BACKENDS,
+                        help="backend di riserva per risposte lente o fallite, es. llama oppure openai:gpt-4o-mini")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=MAX_IN_FLIGHT, help="richieste al modello in parallelo")
+    parser.add_argument("--embeddings", choices=sorted(EMBEDDING_BACKENDS), default=None,
+                        help="embedding per i nuovi indici (predefiniti quelli del backend)")
+    args = parser.parse_args(argv)
+
+    backend = make_router(make_backend(args.backend), args.fallback)
+    service = ChatbotService(backend, max(1, args.concurrency), args.embeddings)
+    httpd = ThreadingHTTPServer((args.host, args.port), ChatbotHandler)
+    httpd.daemon_threads = True
+    httpd.service = service
+    print(f"ChatBot {args.backend} in ascolto su http://{args.host}:{args.port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.engine.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+from langchain_core.documents import Document
+
+from chatbot_core.context import pack_context
+
+
+def chunk(doc_hash, text, start, title="Lezione1.pdf", page=1):
+    return Document(id=f"{doc_hash}:{start}:{page}-{page}", page_content=text,
+                    metadata={"source": title, "start_index": start, "page": page, "page_end": page})
+
+
+def test_overlapping_chunks_of_one_document_are_merged():
+    first = "Il primo principio della termodinamica"
+    docs = [chunk("a", first, 0), chunk("a", "termodinamica afferma che l'energia si conserva", first.index("termo"))]
+
+    context = pack_context(docs, 1000)
+
+    assert context.count("termodinamica") == 1
+    assert context.count("[Lezione1.pdf, pagina 1]") == 1
+    assert "Il primo principio della termodinamica afferma che l'energia si conserva" in context
+
+
+def test_documents_with_the_same_title_are_kept_apart():
+    docs = [chunk("fisica", "La forza è massa per accelerazione.", 0),
+            chunk("chimica", "Una mole contiene il numero di Avogadro di particelle.", 0)]
+
+    context = pack_context(docs, 1000)
+
+    assert "massa per accelerazione" in context
+    assert "numero di Avogadro" in context
+    assert context.count("[Lezione1.pdf, pagina 1]") == 2
+
+
+def test_budget_keeps_the_most_relevant_segment_first():
+    docs = [chunk("a", "rilevante " * 20, 0, page=1), chunk("a", "secondario " * 200, 5000, page=2)]
+
+    context = pack_context(docs, 60)
+
+    assert "rilevante" in context
+    assert "secondario" not in context
@@ -0,0 +1,52 @@
+import pytest
+
+from chatbot_core.conversation import Conversation
+
+
+class FakeBackend:
+    name = "fake"
+    history_token_budget = 1000
+
+    def count_tokens(self, text):
+        return len(text.split())
+
+
+@pytest.fixture
+def conversation():
+    conversation = Conversation(FakeBackend(), executor=None)
+    conversation.add_turn("Cos'è il ciclo di Carnot?", "È un ciclo termodinamico reversibile.")
+    return conversation
+
+
+@pytest.mark.parametrize("question", [
+    "Cosa dice questo documento sull'entropia?",
+    "What is the Carnot cycle and why is it reversible?",
+    "Questa formula vale anche per i gas reali?",
+    "Riassumi questo capitolo",
+    "Cos'è ciò che chiamiamo entropia?",
+    "Fammi un esempio di macchina termica",
+    "Qual è il rendimento di una macchina di Carnot?",
+])
+def test_standalone_questions(conversation, question):
+    assert not conversation.is_follow_up(question)
+    assert conversation.retrieval_query(question) == question
+
+
+@pytest.mark.parametrize("question", [
+    "E il secondo principio?",
+    "Perché questo è vero?",
+    "Questo cosa significa?",
+    "What does it mean?",
+    "Why is it reversible?",
+    "Spiegalo meglio",
+    "Fammi un altro esempio",
+    "Cos'è?",
+    "Puoi ripetere quello che hai detto?",
+])
+def test_follow_up_questions(conversation, question):
+    assert conversation.is_follow_up(question)
+    assert conversation.retrieval_query(question) == f"Cos'è il ciclo di Carnot? {question}"
+
+
+def test_first_question_is_never_a_follow_up():
+    assert not Conversation(FakeBackend(), executor=None).is_follow_up("Perché questo è vero?")
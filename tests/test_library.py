@@ -0,0 +1,99 @@
+import hashlib
+
+import fitz
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from chatbot_core import embeddings as embeddings_module
+from chatbot_core.embedding_cache import CachedEmbeddings
+from chatbot_core.library import DocumentLibrary
+from chatbot_core.pipeline import index_pdf
+
+
+class FakeEmbeddings(Embeddings):
+    """Vettori deterministici dal testo, senza rete; conta i testi inviati."""
+
+    parallel_requests = 1
+    model = "fake"
+
+    def __init__(self):
+        self.texts = []
+
+    def _vector(self, text):
+        return [b / 255 for b in hashlib.sha256(text.encode("utf-8")).digest()[:16]]
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    inner = FakeEmbeddings()
+    monkeypatch.setitem(embeddings_module.EMBEDDING_BACKENDS, "fake", lambda: inner)
+    embeddings_module.make_embeddings.cache_clear()
+    yield inner
+    embeddings_module.make_embeddings.cache_clear()
+
+
+@pytest.fixture
+def library(tmp_path):
+    return DocumentLibrary(str(tmp_path / "library"), index_format="flat")
+
+
+@pytest.fixture
+def embeddings(tmp_path, fake):
+    return CachedEmbeddings(fake, path=str(tmp_path / "cache.sqlite"), name="fake")
+
+
+def make_pdf(path, pages):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with fitz.open() as doc:
+        for text in pages:
+            doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), text, fontsize=11)
+        doc.save(str(path))
+    return str(path)
+
+
+def lesson(subject, sentences=6):
+    return " ".join(f"Frase {i} della lezione di {subject}, con abbastanza testo da formare un chunk."
+                    for i in range(sentences))
+
+
+def test_same_title_from_another_folder_keeps_both_documents(tmp_path, library, embeddings):
+    physics = index_pdf(make_pdf(tmp_path / "fis" / "Lezione1.pdf", [lesson("fisica")]), library, embeddings)
+    chemistry = index_pdf(make_pdf(tmp_path / "chim" / "Lezione1.pdf", [lesson("chimica")]), library, embeddings)
+
+    assert physics != chemistry
+    assert physics in library and chemistry in library
+    assert library.load(physics).index.ntotal and library.load(chemistry).index.ntotal
+
+
+def test_new_version_reuses_unchanged_chunks_and_keeps_base(tmp_path, library, embeddings, fake):
+    first = index_pdf(make_pdf(tmp_path / "v1" / "Lezione1.pdf", [lesson("fisica"), lesson("ottica")]),
+                      library, embeddings)
+    fake.texts.clear()
+    # Cache degli embedding vuota: i chunk invariati devono arrivare dall'indice precedente, non dalla cache
+    fresh = CachedEmbeddings(fake, path=str(tmp_path / "cache2.sqlite"), name="fake")
+    second = index_pdf(make_pdf(tmp_path / "v2" / "Lezione1.pdf", [lesson("fisica"), lesson("acustica")]),
+                       library, fresh)
+
+    assert first in library and second in library
+    # Solo i chunk della pagina cambiata passano dal modello di embedding
+    assert fake.texts and all("acustica" in text for text in fake.texts)
+    texts = [doc.page_content for doc in library.load(second).docstore._dict.values()]
+    assert any("fisica" in text for text in texts) and not any("ottica" in text for text in texts)
+
+
+def test_documents_sharing_a_chunk_can_be_queried_together(tmp_path, library, embeddings):
+    shared = lesson("introduzione")
+    a = index_pdf(make_pdf(tmp_path / "a.pdf", [shared, lesson("fisica")]), library, embeddings)
+    b = index_pdf(make_pdf(tmp_path / "b.pdf", [shared, lesson("chimica")]), library, embeddings)
+
+    merged = library.load_merged([a, b])
+
+    assert merged.index.ntotal == library.load(a).index.ntotal + library.load(b).index.ntotal